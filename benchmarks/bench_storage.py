@@ -0,0 +1,61 @@
+"""
+Compare the write and read throughput of the storage backends.
+
+Usage:
+
+    $ python benchmarks/bench_storage.py [number_of_tasks]
+
+"""
+
+import os
+import pathlib
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).parents[1]))
+
+import flowtime_logger.storage as storage  # noqa: E402
+from tests.test_storage import make_task  # noqa: E402
+
+
+def make_tasks(count, breaks=3):
+    """Create a list of ended tasks with the given number of breaks each."""
+    return [make_task(f'task {i}', breaks) for i in range(count)]
+
+
+def bench(name, backend, tasks):
+    start = time.perf_counter()
+    for task in tasks:
+        backend.save_task(task)
+    write_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    backend.tasks()
+    backend.periods()
+    read_time = time.perf_counter() - start
+    backend.close()
+
+    print(f'{name:<24}{len(tasks) / write_time:>14,.0f}'
+          f'{read_time * 1000:>14.1f}')
+
+
+def main(count=2000):
+    tasks = make_tasks(count)
+    print(f'{count} tasks, {len(storage.task_periods(tasks[0]))} periods each')
+    print(f'{"backend":<24}{"saves/s":>14}{"read all ms":>14}')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        bench('memory', storage.MemoryBackend(), tasks)
+        bench('sqlite', storage.SQLiteBackend(
+            os.path.join(tmp_dir, 'default.db')), tasks)
+        bench('sqlite WAL/NORMAL', storage.SQLiteBackend(
+            os.path.join(tmp_dir, 'wal.db'), journal_mode='WAL',
+            synchronous='NORMAL'), tasks)
+        bench('append-only', storage.AppendOnlyBackend(
+            os.path.join(tmp_dir, 'flogger.jsonl')), tasks)
+        bench('append-only fsync', storage.AppendOnlyBackend(
+            os.path.join(tmp_dir, 'fsync.jsonl'), fsync=True), tasks)
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
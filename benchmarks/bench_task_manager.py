@@ -0,0 +1,73 @@
+"""
+Measure how the TaskManager scales with the number of active tasks.
+
+Every task is given the same number of work and break periods, so that the
+results only depend on the number of tasks. Reports the cost of switching
+to a task and continuing it in exclusive mode, the cost of one timer tick
+per task (computing the worked time of every active task) and the memory
+used per active task.
+
+Usage:
+
+    $ python benchmarks/bench_task_manager.py [periods_per_task]
+
+"""
+
+import pathlib
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, str(pathlib.Path(__file__).parents[1]))
+
+import flowtime_logger.logger as logger  # noqa: E402
+import flowtime_logger.storage as storage  # noqa: E402
+
+
+def make_manager(count, breaks):
+    """Create a manager with count tasks that each have breaks breaks."""
+    manager = logger.TaskManager(storage.MemoryBackend())
+    for i in range(count):
+        task = manager.start(f'task {i}')
+        for _ in range(breaks):
+            manager.stop(task)
+            manager.cont(task)
+    return manager
+
+
+def bench(count, breaks, rounds=1000):
+    tracemalloc.start()
+    manager = make_manager(count, breaks)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(100):
+        for task in manager.tasks:
+            task.work_time()
+    tick_time = (time.perf_counter() - start) / 100
+
+    # Switching adds periods, so it is measured after the tick.
+    tasks = manager.tasks
+    start = time.perf_counter()
+    for i in range(rounds):
+        manager.switch(tasks[i % count])
+        if not manager.current.task_running:
+            manager.cont()
+    switch_time = (time.perf_counter() - start) / rounds
+
+    print(f'{count:>6}{switch_time * 1e6:>14.1f}'
+          f'{tick_time / count * 1e6:>18.2f}'
+          f'{memory / count / 1024:>14.1f}')
+
+
+def main(breaks=5):
+    print(f'{breaks} breaks per task')
+    print(f'{"tasks":>6}{"switch us":>14}{"tick us/task":>18}'
+          f'{"KiB/task":>14}')
+    for count in (1, 10, 50, 100):
+        bench(count, breaks)
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
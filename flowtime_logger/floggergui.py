@@ -10,6 +10,7 @@ FLoggerGUI
 """
 
 import atexit
+from datetime import timedelta
 from tkinter import ttk
 
 
@@ -24,6 +25,9 @@ class FLoggerGUI():  # View
     - state2()
     - state3()
     - state4()
+    - set_min_size()
+    - show_task()
+    - update_task_list()
 
     For more information about the methods,
     check each method's individual docstring.
@@ -51,6 +55,9 @@ class FLoggerGUI():  # View
                     - button1
                     - button2
                     - button3
+                - list_frame
+                    - task_list
+                    - new_button
 
         """
 
@@ -65,6 +72,8 @@ class FLoggerGUI():  # View
         self.time_frame.grid(column=0, row=1, sticky='we')
         self.button_frame = ttk.Frame(self.main_frame)
         self.button_frame.grid(column=0, row=2, sticky='wes')
+        self.list_frame = ttk.Frame(self.main_frame)
+        self.list_frame.grid(column=0, row=3, sticky='nwes')
 
         # Set resizing magic for the frames
         self.parent.columnconfigure(0, weight=1)
@@ -73,12 +82,15 @@ class FLoggerGUI():  # View
         self.main_frame.rowconfigure(0, weight=1, uniform='b')
         self.main_frame.rowconfigure(1, weight=1, uniform='b')
         self.main_frame.rowconfigure(2, weight=1, uniform='b')
+        self.main_frame.rowconfigure(3, weight=3)
         self.entry_frame.columnconfigure(0, weight=1, uniform='a')
         self.entry_frame.columnconfigure(1, weight=1, uniform='a')
         self.time_frame.columnconfigure(0, weight=1, uniform='a')
         self.time_frame.columnconfigure(1, weight=1, uniform='a')
         self.button_frame.columnconfigure(0, weight=1, uniform='a')
         self.button_frame.columnconfigure(1, weight=1, uniform='a')
+        self.list_frame.columnconfigure(0, weight=1)
+        self.list_frame.rowconfigure(0, weight=1)
 
         # Create widgets inside the frames
         self.td_label = ttk.Label(self.entry_frame, text='Task description')
@@ -92,7 +104,19 @@ class FLoggerGUI():  # View
         self.button2 = ttk.Button(self.button_frame, text='Stop', width=7,
                                   state='disabled')
         self.button3 = ttk.Button(self.button_frame, text='Quit', width=7,
-                                  command=quit)
+                                  command=self.controller.exit_handler)
+        self.task_list = ttk.Treeview(self.list_frame, height=4,
+                                      columns=('state', 'worked'),
+                                      selectmode='browse')
+        self.task_list.heading('#0', text='Active tasks')
+        self.task_list.heading('state', text='State')
+        self.task_list.heading('worked', text='Worked')
+        self.task_list.column('state', width=70, stretch=False)
+        self.task_list.column('worked', width=70, stretch=False)
+        self.new_button = ttk.Button(self.list_frame, text='New', width=7,
+                                     command=self.controller.new_task)
+        # Maps the Treeview item ids to the tasks they represent.
+        self.task_items = {}
 
         # Place widgets
         self.td_label.grid(column=0, row=0, columnspan=2)
@@ -104,12 +128,8 @@ class FLoggerGUI():  # View
         self.button1.grid(column=0, row=0, sticky='e')
         self.button2.grid(column=1, row=0, sticky='w')
         self.button3.grid(column=0, row=1, columnspan=2)
-
-        # Set the minimum size of the window
-        self.parent.update()
-        window_width = self.parent.winfo_width()
-        window_height = self.parent.winfo_height()
-        self.parent.minsize(window_width, window_height)
+        self.task_list.grid(column=0, row=0, sticky='nwes', pady=(6, 0))
+        self.new_button.grid(column=0, row=1)
 
         # Give focus to the Task description entry
         self.td_entry.focus()
@@ -117,8 +137,24 @@ class FLoggerGUI():  # View
         # Run check_entry function on KeyRelease event on the entry box
         self.td_entry.bind('<KeyRelease>', self.check_entry)
 
-        # At program exit run controller.exit_app function
+        # Switch to the task that is selected from the task list
+        self.task_list.bind('<<TreeviewSelect>>', self.select_task)
+
+        # At program exit and when the window is closed run
+        # controller.exit_handler function
         atexit.register(self.controller.exit_handler)
+        self.parent.protocol('WM_DELETE_WINDOW', self.controller.exit_handler)
+
+    def set_min_size(self):
+        """
+        Don't let the window shrink below its initial size.
+
+        Called by the controller once the window has been mapped, so that
+        the requested size is final without forcing a layout pass.
+        """
+
+        self.parent.minsize(self.parent.winfo_reqwidth(),
+                            self.parent.winfo_reqheight())
 
     def check_entry(self, event):
         '''
@@ -184,3 +220,54 @@ class FLoggerGUI():  # View
         self.et_label['text'] = end_time
         self.button1.configure(text='New', command=self.controller.new_task)
         self.button2.state(['disabled'])
+
+    def select_task(self, event):
+        """Tell the controller to switch to the selected task."""
+
+        selection = self.task_list.selection()
+        if selection and selection[0] in self.task_items:
+            self.controller.switch_task(self.task_items[selection[0]])
+
+    def show_task(self, task):
+        """
+        Show an active task in the entry, time and button widgets.
+
+        Call this after switching to another task.
+        """
+
+        self.td_entry.state(['!disabled'])
+        self.td_entry.delete(0, 'end')
+        self.td_entry.insert(0, task.description)
+        self.et_label['text'] = '0'
+        self.state2(task.start_time.strftime('%X'))
+        if not task.task_running:
+            self.state3()
+
+    def update_task_list(self, tasks, current, now=None):
+        """
+        Update the list of active tasks.
+
+        Rows of tasks that are no longer active are removed, rows of new
+        tasks are added and the state and worked time of every row is
+        refreshed.
+        """
+
+        items = {str(id(task)): task for task in tasks}
+        for iid in self.task_items.keys() - items.keys():
+            self.task_list.delete(iid)
+        for iid, task in items.items():
+            worked = timedelta(seconds=int(
+                task.work_time(now).total_seconds()))
+            values = ('Running' if task.task_running else 'Stopped',
+                      str(worked))
+            if iid in self.task_items:
+                self.task_list.item(iid, values=values)
+            else:
+                self.task_list.insert('', 'end', iid, text=task.description,
+                                      values=values)
+        self.task_items = items
+
+        # Keep the selection in sync with the current task
+        selection = (str(id(current)),) if current in tasks else ()
+        if self.task_list.selection() != selection:
+            self.task_list.selection_set(selection)
@@ -1,19 +1,58 @@
 """
 This is the main controller module for the Flowtime logger application.
 
+Command line options, each of which can also be set with an environment
+variable:
+
+--db PATH, FLOGGER_DB
+    Where the tasks are saved. Defaults to flogger.db next to this module.
+--backend KIND, FLOGGER_BACKEND
+    sqlite (the default), append-only or memory.
+--journal-mode MODE, FLOGGER_JOURNAL_MODE
+    The SQLite journal_mode pragma, e.g. WAL.
+--exit-deadline SECONDS, FLOGGER_EXIT_DEADLINE
+    How long saving the active tasks at exit may wait for the database.
+    Defaults to one second.
+--profile, FLOGGER_PROFILE
+    Print how long each phase of the startup and the shutdown took.
+
 Classes
 -------
 
 MainApp
     The controller class for the whole app.
+Profiler
+    Record how long each phase of the startup and shutdown takes.
+
+Functions
+---------
+
+parse_args(argv=None, environ=None)
+    Parse the command line options.
+main(argv=None)
+    Start the app.
 
 """
 
-import sys
-import tkinter as tk
+import time
+
+# Taken before the other imports so that the profile includes them.
+STARTED = time.perf_counter()
 
-from floggergui import FLoggerGUI
-import logger
+import argparse  # noqa: E402
+import os  # noqa: E402
+import signal  # noqa: E402
+import sys  # noqa: E402
+import tkinter as tk  # noqa: E402
+
+if __package__:
+    from .floggergui import FLoggerGUI
+    from . import logger
+    from . import storage
+else:  # Run as a script from the flowtime_logger directory.
+    from floggergui import FLoggerGUI
+    import logger
+    import storage
 
 
 class MainApp:  # Controller
@@ -28,73 +67,350 @@ class MainApp:  # Controller
     - cont_task()
     - end_task()
     - new_task()
+    - switch_task()
+    - tick()
+    - window_mapped()
+    - finish_startup()
+    - recover()
+    - save_all()
     - exit_handler()
 
     For more information about the methods,
     check each method's individual docstring.
+
+    Instance variables
+    ------------------
+
+    first_frame_time : float
+        Seconds from creating the app to drawing the first frame.
+    exit_time : float
+        Seconds exit_handler() took before exiting.
     """
 
-    def __init__(self):
+    # How often the task list is refreshed, in milliseconds.
+    TICK_INTERVAL = 1000
+    # How many seconds the shutdown may spend saving into the backend.
+    EXIT_DEADLINE = 1.0
+    # How many seconds the startup may wait for a busy backend when moving
+    # the recovered tasks into it.
+    RECOVERY_TIMEOUT = 0.2
+
+    def __init__(self, backend=None, exclusive=True,
+                 recovery_path=None,
+                 exit_deadline=EXIT_DEADLINE, profile=False, mainloop=True):
         """
         Initialize the app.
 
+        Parameters
+        ----------
+
+        backend : storage.StorageBackend, optional
+            Where the tasks are saved. Defaults to a SQLiteBackend using
+            flogger.db next to the app.
+        exclusive : boolean
+            If True, starting or continuing a task stops the task that is
+            currently running.
+        recovery_path : str or path-like, optional
+            The file the tasks are saved into if they can't be saved into the
+            backend within exit_deadline. They are moved into the backend on
+            the next start. Defaults to backend.recovery_file(), i.e.
+            <db>.recovery.jsonl next to a SQLiteBackend's database. Not used
+            with backends whose recovery_file() is None.
+        exit_deadline : float
+            How many seconds the shutdown may spend saving into the backend.
+        profile : boolean
+            Print how long each phase of the startup and shutdown took.
+        mainloop : boolean
+            Start the Tk mainloop. The tests drive the event loop themselves.
+
+        - Create the storage backend and the task manager.
         - Create the root window.
         - Load the logger GUI
+        - Schedule the rest of the startup for after the window is mapped
         - Start the mainloop
 
+        The database is not opened until the window has been drawn.
+
         """
 
+        self.init_started = time.perf_counter()
+        self.profiler = Profiler(profile, STARTED)
+        self.profiler.mark('imports')
+        if backend is None:
+            backend = storage.SQLiteBackend()
+        if backend.recovery_file() is None:
+            recovery_path = None
+        elif recovery_path is None:
+            recovery_path = backend.recovery_file()
+        self.backend = backend
+        self.recovery_path = recovery_path
+        self.exit_deadline = exit_deadline
+        self.manager = logger.TaskManager(self.backend, exclusive)
+        self.first_frame_time = None
+        self.exit_time = None
+        self.exiting = False
         self.root = tk.Tk()
         self.root.title("Flowtime logger")
+        self.profiler.mark('create window')
         self.gui = FLoggerGUI(self.root, self)
-        self.root.mainloop()
+        self.profiler.mark('create widgets')
+        signal.signal(signal.SIGTERM, self.exit_handler)
+        self._map_binding = self.root.bind('<Map>', self.window_mapped)
+        if mainloop:
+            self.root.mainloop()
+
+    @property
+    def task(self):
+        """The current task, or None."""
+
+        return self.manager.current
 
     def start_task(self):
-        """Start the task."""
+        """Start a new task."""
 
         self.description = self.gui.td_entry.get()
-        self.task = logger.Task(self.description)
-        self.gui.state2(self.task.start_time.strftime('%X'))
+        task = self.manager.start(self.description)
+        self.gui.state2(task.start_time.strftime('%X'))
+        self.refresh()
 
     def stop_task(self):
-        """Stop the task."""
+        """Stop the current task."""
 
-        self.task.stop()
+        self.manager.stop()
         self.gui.state3()
+        self.refresh()
 
     def cont_task(self):
-        """Continue the task."""
+        """Continue the current task."""
 
-        self.task.cont()
-        self.gui.state2(self.task.start_time.strftime('%X'))
+        task = self.manager.cont()
+        self.gui.state2(task.start_time.strftime('%X'))
+        self.refresh()
 
     def end_task(self):
-        """End and save the task into database."""
+        """End and save the current task into database."""
 
-        self.task.end()
-        self.task.save()
-        self.gui.state4(self.task.end_time.strftime('%X'))
+        task = self.manager.end()
+        self.gui.state4(task.end_time.strftime('%X'))
+        self.refresh()
 
     def new_task(self):
-        """Create a new task."""
+        """Create a new task. Other active tasks are left as they are."""
 
+        self.manager.current = None
         self.gui.state1()
+        self.refresh()
+
+    def switch_task(self, task):
+        """Make the given active task the current task and show it."""
+
+        if task is self.manager.current:
+            return
+        self.manager.switch(task)
+        self.gui.show_task(task)
+
+    def refresh(self):
+        """Update the task list in the GUI."""
+
+        self.gui.update_task_list(self.manager.tasks, self.manager.current)
+
+    def tick(self):
+        """
+        Refresh the task list and schedule the next tick.
+
+        This is the only timer loop in the app, no matter how many tasks
+        are active.
+        """
+
+        self.refresh()
+        self.root.after(self.TICK_INTERVAL, self.tick)
+
+    def window_mapped(self, event):
+        """
+        Finish the startup once the root window is on the screen.
+
+        Runs once. The window is drawn by idle callbacks that are already
+        queued, so finish_startup() is queued after them.
+        """
+
+        # The children's <Map> events are also delivered to the root.
+        if event.widget is not self.root:
+            return
+        self.root.unbind('<Map>', self._map_binding)
+        self.gui.set_min_size()
+        self.root.after_idle(self.finish_startup)
+
+    def finish_startup(self):
+        """
+        Do the startup work that can wait until the window has been drawn.
+
+        - Save the tasks left in the recovery file into the backend.
+        - Open the backend, so that saving at exit doesn't have to.
+        - Start the timer loop.
+
+        If the backend is busy or broken the app keeps running. The
+        recovery file is kept and tried again on the next start.
+        """
+
+        self.profiler.mark('first frame')
+        self.first_frame_time = time.perf_counter() - self.init_started
+        try:
+            self.recover()
+            self.backend.open()
+        except Exception as error:
+            print(f'Could not open the storage: {error}', file=sys.stderr)
+        finally:
+            self.profiler.mark('open storage')
+            self.tick()
 
-    def exit_handler(self):
+    def recover(self):
+        """
+        Move the tasks from the recovery file into the backend.
+
+        Waits at most RECOVERY_TIMEOUT seconds for a busy backend, so that
+        the window doesn't freeze. The file is only removed once the tasks
+        have been saved.
+        """
+
+        if self.recovery_path is None or \
+                not os.path.exists(self.recovery_path):
+            return
+        with storage.AppendOnlyBackend(self.recovery_path) as recovery:
+            changes = recovery.changes()
+        timeout = self.backend.get_timeout()
+        self.backend.set_timeout(self.RECOVERY_TIMEOUT)
+        try:
+            # Tasks are matched by uid, so this is safe to repeat if the app
+            # is interrupted before the file is removed.
+            self.backend.apply_changes(changes)
+        finally:
+            self.backend.set_timeout(timeout)
+        os.remove(self.recovery_path)
+
+    def save_all(self):
+        """
+        End and save all the active tasks and close the backend.
+
+        Saving into the backend may take at most exit_deadline seconds. The
+        tasks that can't be saved in time are written into the recovery file.
+        """
+
+        deadline = time.monotonic() + self.exit_deadline
+        recovery = None
+        if self.recovery_path is not None:
+            recovery = storage.AppendOnlyBackend(self.recovery_path)
+        self.manager.end_all(deadline, recovery)
+        if recovery is not None:
+            # One fsync for all the tasks, however many missed the deadline.
+            recovery.sync()
+            recovery.close()
+        self.backend.close()
+
+    def exit_handler(self, *args):
         '''
-        Stops and ends the task if it's running before exiting the program.
+        Stops, ends and saves all the active tasks before exiting the program.
+
+        See save_all() for how long saving may take.
+
+        Called by the Quit button, by closing the window, on SIGTERM and at
+        exit. Only the first call does anything.
         '''
 
-        try:  # Raises an AttributeError if no task was started.
-            if self.task.task_running:
-                self.task.stop()
-            if not self.task.task_ended:
-                self.task.end()
-                self.task.save()
-        except AttributeError:
+        if self.exiting:
+            return
+        self.exiting = True
+        started = time.perf_counter()
+        self.profiler.mark('running')
+        self.save_all()
+        self.profiler.mark('save tasks')
+        try:
+            self.root.destroy()
+        except tk.TclError:  # The window has already been destroyed.
             pass
+        self.profiler.mark('destroy window')
+        self.exit_time = time.perf_counter() - started
+        self.profiler.report()
         sys.exit()
 
 
+class Profiler:
+    """
+    Record how long each phase of the startup and shutdown takes.
+
+    The phases are always recorded, but only reported if the profiler is
+    enabled.
+
+    Parameters
+    ----------
+
+    enabled : boolean
+        Whether report() prints anything.
+    start : float, optional
+        The time.perf_counter() value the first phase started at.
+
+    """
+
+    def __init__(self, enabled=False, start=None):
+        self.enabled = enabled
+        self.start = self.last = start or time.perf_counter()
+        self.phases = []
+
+    def mark(self, phase):
+        """End the current phase and give it a name."""
+
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def report(self, file=None):
+        """Print the phases and their durations, if enabled."""
+
+        if not self.enabled:
+            return
+        file = file or sys.stderr
+        for phase, seconds in self.phases:
+            print(f'{phase:<20}{seconds * 1000:>10.1f} ms', file=file)
+        print(f'{"total":<20}{(self.last - self.start) * 1000:>10.1f} ms',
+              file=file)
+
+
+def parse_args(argv=None, environ=None):
+    """
+    Parse the command line options.
+
+    The environment variables give the defaults for the options.
+    """
+
+    if environ is None:
+        environ = os.environ
+    parser = argparse.ArgumentParser(description='Flowtime logger')
+    parser.add_argument('--db', default=environ.get('FLOGGER_DB'),
+                        metavar='PATH', help='where the tasks are saved')
+    parser.add_argument('--backend', choices=storage.BACKENDS,
+                        default=environ.get('FLOGGER_BACKEND', 'sqlite'),
+                        help='how the tasks are saved')
+    parser.add_argument('--journal-mode',
+                        default=environ.get('FLOGGER_JOURNAL_MODE'),
+                        metavar='MODE', help='SQLite journal_mode pragma')
+    parser.add_argument('--exit-deadline', type=float,
+                        default=float(environ.get('FLOGGER_EXIT_DEADLINE',
+                                                  MainApp.EXIT_DEADLINE)),
+                        metavar='SECONDS',
+                        help='how long saving at exit may wait for the DB')
+    parser.add_argument('--profile', action='store_true',
+                        default=bool(environ.get('FLOGGER_PROFILE')),
+                        help='print how long the startup and shutdown took')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Start the app with the command line options."""
+
+    args = parse_args(argv)
+    return MainApp(backend=storage.open_backend(args.backend, args.db,
+                                                args.journal_mode),
+                   exit_deadline=args.exit_deadline, profile=args.profile)
+
+
 if __name__ == "__main__":
-    main = MainApp()
+    main()
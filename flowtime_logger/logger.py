@@ -6,12 +6,25 @@ Classes:
 
 Task
     A class to represent a task being performed.
+TaskManager
+    Keep track of several tasks that are being performed in parallel.
 
 """
 
-from datetime import datetime
-import pathlib
-import sqlite3
+from datetime import datetime, timedelta
+import time
+import uuid
+
+
+def current_time():
+    """
+    Return the current time as an aware datetime in the local UTC offset.
+
+    Keeping the offset makes the times unambiguous across DST changes and
+    time zones.
+    """
+
+    return datetime.now().astimezone()
 
 
 class Task:
@@ -34,22 +47,31 @@ class Task:
         Continue the task.
     end()
         End the task.
-    save()
-        Save the task.
+    save(backend)
+        Save the task using a storage backend.
+    work_time(now=None)
+        Return the total length of the work periods.
 
     Instance variables
     ------------------
 
     description : str
         Description of the task.
+    uid : str
+        A globally unique id for the task. Used to tell tasks apart when
+        databases from different machines are synced.
     start_time : datetime object
-        Start time of the task.
+        Start time of the task. All the times are aware datetimes in the
+        local UTC offset at the time they were captured.
     end_time : datetime object
         End time of the task.
     wp_list : list
         A list containing work period objects.
     bp_list : list
         A list containing break period objects.
+    closed_work_time : timedelta object
+        Total length of the work periods that have ended. Kept up to date
+        by the work periods so that work_time() doesn't have to add them up.
     task_running : boolean
         Indicates whether the task is running or not.
 
@@ -76,7 +98,9 @@ class Task:
 
         """
 
-        self.start_time = datetime.now()
+        self.start_time = current_time()
+        self.uid = uuid.uuid4().hex
+        self.closed_work_time = timedelta()
         self.wp_count = 0
         self.wp_list = [WorkPeriod(self)]
         self.description = description
@@ -132,87 +156,34 @@ class Task:
         # task and not taking another break
         self.bp_list.pop()
 
-    def save(self, database='flogger.db'):
+    def save(self, backend):
         """
-        Save the Task, WorkPeriod and BreakPeriod data into a SQLite database.
+        Save the Task, WorkPeriod and BreakPeriod data using a storage backend.
 
-        The default filename for the database is: flogger.db
+        Parameters
+        ----------
+
+        backend : storage.StorageBackend
+            The backend to save the task into, e.g. a SQLiteBackend.
 
-        Tables:
-        -------
+        Returns the id the backend assigned to the task.
 
-        Tasks
-            id, description, start_time, end_time
-        Periods
-            id, type, start_time, end_time, task_id
+        """
+
+        return backend.save_task(self)
 
+    def work_time(self, now=None):
         """
+        Return the total length of the work periods as a timedelta.
 
-        flogger_dir = pathlib.Path(__file__).parent
-        path_to_db = flogger_dir.joinpath(flogger_dir, database)
-
-        conn = sqlite3.connect(path_to_db,
-                               detect_types=sqlite3.PARSE_DECLTYPES |
-                               sqlite3.PARSE_COLNAMES)
-        c = conn.cursor()
-
-        # Create tables
-        try:  # Raises an OperationalError if the table already exists.
-            with conn:
-                c.execute("""CREATE TABLE Tasks (
-                             id INTEGER PRIMARY KEY,
-                             description TEXT,
-                             start_time timestamp,
-                             end_time timestamp
-                         )""")
-        except sqlite3.OperationalError:
-            pass
-
-        try:  # Raises an OperationalError if the table already exists.
-            with conn:
-                c.execute("""CREATE TABLE Periods (
-                             id INTEGER PRIMARY KEY,
-                             type TEXT,
-                             start_time timestamp,
-                             end_time timestamp,
-                             task_id INTEGER
-                         )""")
-        except sqlite3.OperationalError:
-            pass
-
-        with conn:
-            # Insert task into database.
-            c.execute("""INSERT INTO Tasks (description, start_time, end_time)
-                         VALUES (:description, :start, :end)""",
-                      {'description': self.description,
-                       'start': self.start_time,
-                       'end': self.end_time})
-
-            # Fetch the task id from database...
-            c.execute("""SELECT id FROM Tasks WHERE
-                         start_time = :start""",
-                      {'start': self.start_time})
-
-            # ...and assign it to a task_id variable.
-            task_id = c.fetchone()[0]
-
-            # Insert work periods into database.
-            for wp in self.wp_list:
-                c.execute("""INSERT INTO Periods (type, start_time, end_time,
-                             task_id) VALUES (:type, :start, :end, :task)""",
-                          {'type': 'wp',
-                           'start': wp.wp_start_time,
-                           'end': wp.wp_end_time,
-                           'task': task_id})
-
-            # Insert break periods into database.
-            for bp in self.bp_list:
-                c.execute("""INSERT INTO Periods (type, start_time, end_time,
-                             task_id) VALUES (:type, :start, :end, :task)""",
-                          {'type': 'bp',
-                           'start': bp.bp_start_time,
-                           'end': bp.bp_end_time,
-                           'task': task_id})
+        A work period that is still running is counted up to now.
+        """
+
+        if not self.task_running:
+            return self.closed_work_time
+        if now is None:
+            now = current_time()
+        return self.closed_work_time + now - self.wp_list[-1].wp_start_time
 
 
 class WorkPeriod:
@@ -242,7 +213,8 @@ class WorkPeriod:
         self.wp_end_time = None
 
     def end_wp(self):
-        self.wp_end_time = datetime.now()
+        self.wp_end_time = current_time()
+        self.master.closed_work_time += self.wp_end_time - self.wp_start_time
 
 
 class BreakPeriod:
@@ -273,4 +245,174 @@ class BreakPeriod:
     def end_bp(self):
         """Set the break period end time"""
 
-        self.bp_end_time = datetime.now()
+        self.bp_end_time = current_time()
+
+
+class TaskManager:
+
+    """
+    Keep track of several tasks that are being performed in parallel.
+
+    All the tasks are saved into the same storage backend when they are
+    ended.
+
+    Parameters
+    ----------
+
+    backend : storage.StorageBackend
+        The backend the ended tasks are saved into.
+    exclusive : boolean
+        If True, starting or continuing a task stops the task that is
+        currently running, so that at most one task is running at a time.
+
+    Methods
+    -------
+
+    start(description)
+        Start a new task and make it the current task.
+    switch(task)
+        Make an active task the current task.
+    stop(task=None)
+        Stop a task.
+    cont(task=None)
+        Continue a task.
+    end(task=None)
+        End a stopped task, save it and remove it from the active tasks.
+    end_all(deadline=None, fallback=None)
+        Stop, end and save all the active tasks.
+
+    Instance variables
+    ------------------
+
+    current : Task object or None
+        The task the user is currently looking at.
+    tasks : list
+        The active tasks in the order they were started.
+
+    """
+
+    def __init__(self, backend, exclusive=True):
+        self.backend = backend
+        self.exclusive = exclusive
+        self.current = None
+        # Tasks that haven't been ended yet. Dicts keep insertion order, so
+        # this doubles as an ordered set with O(1) removal.
+        self._active = {}
+        # The task that is running in exclusive mode. Tracking it means
+        # starting a task never has to look at the other tasks.
+        self._running = None
+
+    @property
+    def tasks(self):
+        return list(self._active)
+
+    def __len__(self):
+        return len(self._active)
+
+    def __contains__(self, task):
+        return task in self._active
+
+    def start(self, description):
+        """Start a new task and make it the current task."""
+
+        self._pause_running()
+        task = Task(description)
+        self._active[task] = None
+        self._running = task
+        self.current = task
+        return task
+
+    def switch(self, task):
+        """Make an active task the current task."""
+
+        assert task in self._active, 'Can\'t switch to a Task that is not\
+ active.'
+        self.current = task
+        return task
+
+    def stop(self, task=None):
+        """Stop a task. Defaults to the current task."""
+
+        task = self._get(task)
+        task.stop()
+        if task is self._running:
+            self._running = None
+        return task
+
+    def cont(self, task=None):
+        """Continue a task. Defaults to the current task."""
+
+        task = self._get(task)
+        if task is not self._running:
+            self._pause_running()
+        task.cont()
+        self._running = task
+        return task
+
+    def end(self, task=None):
+        """
+        End a task, save it and remove it from the active tasks.
+
+        Defaults to the current task. The task needs to be stopped first.
+        """
+
+        task = self._get(task)
+        task.end()
+        task.save(self.backend)
+        del self._active[task]
+        if task is self.current:
+            self.current = None
+        return task
+
+    def end_all(self, deadline=None, fallback=None):
+        """
+        Stop, end and save all the active tasks.
+
+        Parameters
+        ----------
+
+        deadline : float, optional
+            A time.monotonic() value. Saves into the backend are only
+            allowed to wait for a busy resource until the deadline, and once
+            it has passed the remaining tasks are saved into the fallback.
+        fallback : storage.StorageBackend, optional
+            A backend that is fast and always available, e.g. an
+            AppendOnlyBackend recovery file. Also used if saving into the
+            backend fails.
+
+        """
+
+        for task in self.tasks:
+            if task.task_running:
+                self.stop(task)
+            task.end()
+            self._save(task, deadline, fallback)
+            del self._active[task]
+        self.current = None
+
+    def _save(self, task, deadline, fallback):
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 and fallback is not None:
+                task.save(fallback)
+                return
+            self.backend.set_timeout(max(remaining, 0))
+        if fallback is None:
+            task.save(self.backend)
+            return
+        try:
+            task.save(self.backend)
+        except Exception:
+            # Whatever went wrong, the task must not be lost.
+            task.save(fallback)
+
+    def _get(self, task):
+        if task is None:
+            task = self.current
+        assert task in self._active, 'The Task is not active.'
+        return task
+
+    def _pause_running(self):
+        if (self.exclusive and self._running is not None
+                and self._running.task_running):
+            self.stop(self._running)
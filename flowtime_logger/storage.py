@@ -0,0 +1,820 @@
+"""
+Storage backends for persisting logged tasks.
+
+Every backend implements the same small interface so that Task and MainApp
+don't need to know where the data ends up.
+
+Classes
+-------
+
+StorageBackend
+    The interface shared by all the storage backends.
+MemoryBackend
+    Keep the tasks in memory. Useful for tests and benchmarks.
+SQLiteBackend
+    Save the tasks into a SQLite database.
+AppendOnlyBackend
+    Append the tasks into a JSON lines file. Useful for write-heavy use.
+
+Functions
+---------
+
+open_backend(kind='sqlite', path=None, journal_mode=None)
+    Create a backend by name, e.g. from a command line option.
+recovery_path(db_path)
+    Return the path of the recovery file that belongs to a database.
+dump_time(value)
+    Format a datetime as a JSON friendly string.
+load_time(value)
+    Parse a string written by dump_time().
+
+"""
+
+import abc
+import contextlib
+from datetime import datetime, timedelta, timezone
+import json
+import os
+import pathlib
+import uuid
+
+
+DEFAULT_DB_PATH = pathlib.Path(__file__).parent.joinpath('flogger.db')
+
+
+class StorageBackend(abc.ABC):
+
+    """
+    The interface shared by all the storage backends.
+
+    Tasks are returned as (id, description, start_time, end_time) tuples and
+    periods as (id, type, start_time, end_time, task_id) tuples, which are
+    the same shapes as the rows in the SQLite database. The times are aware
+    datetimes in the UTC offset they were captured in.
+
+    The day lookups go by the local day, i.e. the date in the offset the
+    start time was captured in, so a task started at 23:30 in Helsinki
+    belongs to that day no matter where the lookup is made.
+
+    Methods
+    -------
+
+    save_task(task)
+        Save an ended task and its periods. Returns the id of the task.
+    tasks()
+        Return a list of all the saved tasks.
+    periods(task_id=None)
+        Return a list of the saved periods, optionally only for one task.
+    tasks_between(first_day, last_day)
+        Return the tasks started on the given local days, inclusive.
+    periods_between(first_day, last_day)
+        Return the periods started on the given local days, inclusive.
+    tasks_on(day), tasks_in_week(day), tasks_in_month(day)
+        Return the tasks started on the day, or in the week (Monday to
+        Sunday) or the month of the day.
+    open()
+        Acquire the resources needed for saving ahead of time.
+    set_timeout(seconds)
+        Limit how long a save may wait for a busy resource.
+    get_timeout()
+        Return the current limit, or None if the backend never waits.
+    recovery_file()
+        Return the path of the file the app saves the tasks into when the
+        backend is unavailable, or None if the backend doesn't need one.
+        Backends that return a path also implement apply_changes(changes),
+        which the app uses to move the tasks from the file back in.
+    close()
+        Release any resources held by the backend.
+
+    """
+
+    @abc.abstractmethod
+    def save_task(self, task):
+        pass
+
+    @abc.abstractmethod
+    def tasks(self):
+        pass
+
+    @abc.abstractmethod
+    def periods(self, task_id=None):
+        pass
+
+    def tasks_between(self, first_day, last_day):
+        # Backends with an index on the local day override this.
+        return [task for task in self.tasks()
+                if first_day <= task[2].date() <= last_day]
+
+    def periods_between(self, first_day, last_day):
+        return [period for period in self.periods()
+                if first_day <= period[2].date() <= last_day]
+
+    def tasks_on(self, day):
+        return self.tasks_between(day, day)
+
+    def tasks_in_week(self, day):
+        monday = day - timedelta(days=day.weekday())
+        return self.tasks_between(monday, monday + timedelta(days=6))
+
+    def tasks_in_month(self, day):
+        first_day = day.replace(day=1)
+        next_month = (first_day + timedelta(days=31)).replace(day=1)
+        return self.tasks_between(first_day, next_month - timedelta(days=1))
+
+    def open(self):
+        pass
+
+    def set_timeout(self, seconds):
+        pass
+
+    def get_timeout(self):
+        return None
+
+    def recovery_file(self):
+        return None
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+BACKENDS = ('sqlite', 'append-only', 'memory')
+
+
+def open_backend(kind='sqlite', path=None, journal_mode=None):
+    """
+    Create a backend by name.
+
+    Parameters
+    ----------
+
+    kind : str
+        One of BACKENDS.
+    path : str or path-like, optional
+        Where the tasks are saved. Defaults to flogger.db (or flogger.jsonl
+        for the append-only backend) next to this module.
+    journal_mode : str, optional
+        The journal_mode pragma of the SQLite backend.
+
+    """
+
+    if kind == 'sqlite':
+        return SQLiteBackend(path or DEFAULT_DB_PATH,
+                             journal_mode=journal_mode)
+    if kind == 'append-only':
+        return AppendOnlyBackend(path or DEFAULT_DB_PATH.with_suffix('.jsonl'))
+    if kind == 'memory':
+        return MemoryBackend()
+    raise ValueError(f'Unknown backend {kind!r}, expected one of '
+                     f'{", ".join(BACKENDS)}.')
+
+
+def recovery_path(db_path):
+    """
+    Return the path of the recovery file that belongs to a database.
+
+    The file sits next to the database, so that apps using different
+    databases never replay each other's tasks.
+    """
+
+    return pathlib.Path(f'{db_path}.recovery.jsonl')
+
+
+def task_periods(task):
+    """
+    Return the periods of a task as (type, start_time, end_time) tuples.
+
+    Work periods come first, followed by the break periods.
+    """
+
+    periods = [('wp', wp.wp_start_time, wp.wp_end_time)
+               for wp in task.wp_list]
+    periods.extend(('bp', bp.bp_start_time, bp.bp_end_time)
+                   for bp in task.bp_list)
+    return periods
+
+
+class MemoryBackend(StorageBackend):
+
+    """Keep the tasks in memory. Nothing is written to disk."""
+
+    def __init__(self):
+        self._tasks = []
+        self._periods = []
+
+    def save_task(self, task):
+        task_id = len(self._tasks) + 1
+        self._tasks.append((task_id, task.description, task.start_time,
+                            task.end_time))
+        for p_type, start, end in task_periods(task):
+            self._periods.append((len(self._periods) + 1, p_type, start, end,
+                                  task_id))
+        return task_id
+
+    def tasks(self):
+        return list(self._tasks)
+
+    def periods(self, task_id=None):
+        if task_id is None:
+            return list(self._periods)
+        return [p for p in self._periods if p[4] == task_id]
+
+
+class SQLiteBackend(StorageBackend):
+
+    """
+    Save the tasks into a SQLite database.
+
+    The connection is opened on first use and kept open until close() is
+    called. Databases created by older versions are migrated when they are
+    opened.
+
+    Times are stored in UTC together with the UTC offset they were captured
+    in. Both tables also store the local day of the start time, which is
+    indexed so that day, week and month lookups are index range seeks.
+
+    Every task carries a globally unique uid and a per-database change
+    sequence number, which the sync module uses to exchange only the tasks
+    that the other database hasn't seen yet.
+
+    Parameters
+    ----------
+
+    path : str or path-like
+        Path to the database file. Defaults to flogger.db next to this
+        module. Use ':memory:' for a throwaway database.
+    journal_mode : str, optional
+        Value for the journal_mode pragma, e.g. 'WAL'.
+    synchronous : str, optional
+        Value for the synchronous pragma, e.g. 'NORMAL'.
+    timeout : float
+        How many seconds a write waits for a lock held by another
+        connection before giving up.
+
+    Tables:
+    -------
+
+    Tasks
+        id, description, start_time, start_offset, end_time, end_offset,
+        local_day, uid, origin, seq
+    Periods
+        id, type, start_time, start_offset, end_time, end_offset, local_day,
+        task_id
+    SyncState
+        key, value. Holds the db_id of this database.
+    SyncPeers
+        peer_id, last_seq. The last change sequence number pulled from each
+        peer database.
+
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH, journal_mode=None,
+                 synchronous=None, timeout=5.0):
+        self.path = path
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.timeout = timeout
+        self._conn = None
+        self._db_id = None
+
+    @property
+    def conn(self):
+        """The database connection. Opened and set up on first access."""
+
+        if self._conn is None:
+            # Imported here so that the app can show its window before
+            # paying for the import.
+            import sqlite3
+            conn = sqlite3.connect(self.path, timeout=self.timeout,
+                                   detect_types=sqlite3.PARSE_DECLTYPES |
+                                   sqlite3.PARSE_COLNAMES)
+            try:
+                if self.journal_mode:
+                    conn.execute(f'PRAGMA journal_mode={self.journal_mode}')
+                if self.synchronous:
+                    conn.execute(f'PRAGMA synchronous={self.synchronous}')
+                self._create_tables(conn)
+            except Exception:
+                # Don't keep a connection to a database that wasn't set up,
+                # e.g. because it was locked. The next access tries again.
+                conn.close()
+                raise
+            self._conn = conn
+        return self._conn
+
+    def _write(self):
+        return _write(self.conn)
+
+    @staticmethod
+    def _create_tables(conn):
+        # An up to date database can be used without waiting for the write
+        # lock. Otherwise another process may be creating or migrating the
+        # same database, so the version is checked again under the lock.
+        if _schema_version(conn) == len(_MIGRATIONS):
+            return
+        with _write(conn):
+            conn.execute("""CREATE TABLE IF NOT EXISTS Tasks (
+                            id INTEGER PRIMARY KEY,
+                            description TEXT,
+                            start_time timestamp,
+                            end_time timestamp
+                        )""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS Periods (
+                            id INTEGER PRIMARY KEY,
+                            type TEXT,
+                            start_time timestamp,
+                            end_time timestamp,
+                            task_id INTEGER
+                        )""")
+        while True:
+            # Run each migration, DDL included, in one transaction
+            with _write(conn):
+                version = _schema_version(conn)
+                if version >= len(_MIGRATIONS):
+                    break
+                _MIGRATIONS[version](conn)
+                conn.execute(f'PRAGMA user_version={version + 1}')
+
+    @property
+    def db_id(self):
+        """The globally unique id of this database."""
+
+        if self._db_id is None:
+            self._db_id = self.conn.execute("""SELECT value FROM SyncState
+                                               WHERE key = 'db_id'""")\
+                .fetchone()[0]
+        return self._db_id
+
+    def open(self):
+        """Open the connection and migrate the database now."""
+
+        self.conn
+
+    def set_timeout(self, seconds):
+        self.timeout = seconds
+        if self._conn is not None:
+            self._conn.execute(f'PRAGMA busy_timeout={int(seconds * 1000)}')
+
+    def get_timeout(self):
+        return self.timeout
+
+    def recovery_file(self):
+        return recovery_path(self.path)
+
+    def _next_seq(self):
+        # Only call inside _write(), otherwise another connection can take
+        # the same number before this one commits.
+        return self.conn.execute("""SELECT COALESCE(MAX(seq), 0) + 1
+                                    FROM Tasks""").fetchone()[0]
+
+    def _insert_task(self, task, periods, or_ignore=False):
+        """
+        Insert a task row and its period rows. Returns the id of the task,
+        or None if or_ignore is True and the uid was already in the
+        database.
+
+        task is a dict with the keys description, start_time, end_time,
+        uid, origin and seq. periods is a list of (type, start_time,
+        end_time) tuples.
+        """
+
+        c = self._conn.execute(f"""INSERT {'OR IGNORE' if or_ignore else ''}
+                                   INTO Tasks (description, start_time,
+                                   start_offset, end_time, end_offset,
+                                   local_day, uid, origin, seq)
+                                   VALUES (:description, :start_time,
+                                           :start_offset, :end_time,
+                                           :end_offset, :local_day, :uid,
+                                           :origin, :seq)""",
+                               dict(task, **_utc_columns(task['start_time'],
+                                                         task['end_time'])))
+        if not c.rowcount:
+            return None
+        task_id = c.lastrowid
+        self._conn.executemany("""INSERT INTO Periods (type, start_time,
+                                  start_offset, end_time, end_offset,
+                                  local_day, task_id)
+                                  VALUES (:type, :start_time, :start_offset,
+                                          :end_time, :end_offset, :local_day,
+                                          :task_id)""",
+                               [dict(_utc_columns(start, end), type=p_type,
+                                     task_id=task_id)
+                                for p_type, start, end in periods])
+        return task_id
+
+    def save_task(self, task):
+        with self._write():
+            task_id = self._insert_task({'description': task.description,
+                                         'start_time': task.start_time,
+                                         'end_time': task.end_time,
+                                         'uid': task.uid,
+                                         'origin': self.db_id,
+                                         'seq': self._next_seq()},
+                                        task_periods(task))
+        return task_id
+
+    def tasks(self):
+        return [_task_row(row) for row in self.conn.execute(
+            """SELECT id, description, start_time, start_offset, end_time,
+               end_offset FROM Tasks ORDER BY id""")]
+
+    def periods(self, task_id=None):
+        if task_id is None:
+            rows = self.conn.execute("""SELECT id, type, start_time,
+                                        start_offset, end_time, end_offset,
+                                        task_id FROM Periods ORDER BY id""")
+        else:
+            rows = self.conn.execute("""SELECT id, type, start_time,
+                                        start_offset, end_time, end_offset,
+                                        task_id FROM Periods WHERE task_id = ?
+                                        ORDER BY id""", (task_id,))
+        return [_period_row(row) for row in rows]
+
+    def tasks_between(self, first_day, last_day):
+        return [_task_row(row) for row in self.conn.execute(
+            """SELECT id, description, start_time, start_offset, end_time,
+               end_offset FROM Tasks WHERE local_day BETWEEN ? AND ?
+               ORDER BY id""", (first_day, last_day))]
+
+    def periods_between(self, first_day, last_day):
+        return [_period_row(row) for row in self.conn.execute(
+            """SELECT id, type, start_time, start_offset, end_time,
+               end_offset, task_id FROM Periods
+               WHERE local_day BETWEEN ? AND ? ORDER BY id""",
+            (first_day, last_day))]
+
+    def peer_mark(self, peer_id):
+        """Return the last change sequence number pulled from a peer."""
+
+        row = self.conn.execute("""SELECT last_seq FROM SyncPeers
+                                   WHERE peer_id = ?""", (peer_id,)).fetchone()
+        return row[0] if row else 0
+
+    def changes_since(self, seq, exclude_origin=None):
+        """
+        Return the tasks with a change sequence number greater than seq.
+
+        Tasks that were created in the exclude_origin database are left out,
+        since that database already has them.
+
+        Returns a (changes, last_seq) tuple. changes is a list of dicts with
+        the keys uid, origin, description, start_time, end_time and periods,
+        where periods is a list of (type, start_time, end_time) tuples.
+        last_seq is the highest sequence number that was looked at, and is
+        what the peer should pass as seq next time.
+        """
+
+        conn = self.conn
+        rows = conn.execute("""SELECT id, uid, origin, description, start_time,
+                               start_offset, end_time, end_offset, seq
+                               FROM Tasks WHERE seq > ?
+                               ORDER BY seq""", (seq,)).fetchall()
+        if not rows:
+            return [], seq
+        last_seq = rows[-1][-1]
+        changes = {}
+        for (task_id, uid, origin, description, start, start_offset, end,
+             end_offset, _) in rows:
+            if origin != exclude_origin:
+                changes[task_id] = {'uid': uid, 'origin': origin,
+                                    'description': description,
+                                    'start_time': _from_utc(start,
+                                                            start_offset),
+                                    'end_time': _from_utc(end, end_offset),
+                                    'periods': []}
+        for row in conn.execute(
+                """SELECT id, type, start_time, start_offset, end_time,
+                   end_offset, task_id FROM Periods
+                   WHERE task_id IN (SELECT id FROM Tasks WHERE seq > ?)
+                   ORDER BY id""", (seq,)):
+            _, p_type, start, end, task_id = _period_row(row)
+            if task_id in changes:
+                changes[task_id]['periods'].append((p_type, start, end))
+        return list(changes.values()), last_seq
+
+    def apply_changes(self, changes, peer_id=None, last_seq=0):
+        """
+        Insert the changes pulled from a peer and remember last_seq.
+
+        changes are dicts in the format returned by changes_since(). If a
+        change has no origin it is taken to come from this database. If
+        peer_id is None, no sync mark is recorded.
+
+        Tasks whose uid is already in the database are skipped, so applying
+        the same changes twice is harmless. Returns the number of tasks
+        that were inserted.
+        """
+
+        conn = self.conn
+        db_id = self.db_id
+        inserted = 0
+        with self._write():
+            seq = self._next_seq()
+            for change in changes:
+                task = {'origin': db_id, **change, 'seq': seq}
+                if self._insert_task(task, change['periods'],
+                                     or_ignore=True) is None:
+                    continue
+                seq += 1
+                inserted += 1
+            if peer_id is not None:
+                conn.execute("""INSERT INTO SyncPeers (peer_id, last_seq)
+                                VALUES (?, ?) ON CONFLICT (peer_id)
+                                DO UPDATE SET last_seq = MAX(last_seq,
+                                    excluded.last_seq)""",
+                             (peer_id, last_seq))
+        return inserted
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def legacy_uid(description, start_time):
+    """
+    Return a uid for a task that was saved before tasks had uids.
+
+    The uid is derived from the task's data, so copies of the same old
+    database get the same uids and are deduplicated when they are synced.
+    """
+
+    return uuid.uuid5(_LEGACY_NAMESPACE,
+                      f'{start_time.isoformat()} {description}').hex
+
+
+_LEGACY_NAMESPACE = uuid.UUID('6f1c2a64-3c1e-4c0f-9a8e-2f7d4b5e1c90')
+
+
+@contextlib.contextmanager
+def _write(conn):
+    """
+    Run a write transaction that holds the database's write lock from the
+    start, so that nothing read inside it can go stale before the writes
+    are committed.
+    """
+
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        yield conn
+
+
+def _schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def _add_sync_columns(conn):
+    """
+    Add the uid, origin and seq columns and the sync tables.
+
+    Old databases that were merged by re-inserting their rows can hold the
+    same task more than once. Only the copy with the lowest id is kept,
+    since the copies would get the same uid.
+    """
+
+    db_id = uuid.uuid4().hex
+    conn.execute('ALTER TABLE Tasks ADD COLUMN uid TEXT')
+    conn.execute('ALTER TABLE Tasks ADD COLUMN origin TEXT')
+    conn.execute('ALTER TABLE Tasks ADD COLUMN seq INTEGER')
+    rows = conn.execute("""SELECT id, description, start_time FROM Tasks
+                           ORDER BY id""")
+    uids = {}
+    duplicates = []
+    for task_id, description, start in rows.fetchall():
+        uid = legacy_uid(description, start)
+        if uid in uids:
+            duplicates.append((task_id,))
+        else:
+            uids[uid] = task_id
+    conn.executemany('DELETE FROM Periods WHERE task_id = ?', duplicates)
+    conn.executemany('DELETE FROM Tasks WHERE id = ?', duplicates)
+    conn.executemany('UPDATE Tasks SET uid = ?, origin = ?, seq = id '
+                     'WHERE id = ?',
+                     [(uid, db_id, task_id) for uid, task_id in uids.items()])
+    conn.execute('CREATE UNIQUE INDEX Tasks_uid ON Tasks (uid)')
+    conn.execute('CREATE UNIQUE INDEX Tasks_seq ON Tasks (seq)')
+    conn.execute('CREATE INDEX Periods_task_id ON Periods (task_id)')
+    conn.execute("""CREATE TABLE SyncState (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )""")
+    conn.execute("INSERT INTO SyncState (key, value) VALUES ('db_id', ?)",
+                 (db_id,))
+    conn.execute("""CREATE TABLE SyncPeers (
+                    peer_id TEXT PRIMARY KEY,
+                    last_seq INTEGER
+                )""")
+
+
+def _store_utc(conn):
+    """
+    Convert the naive local times into UTC times and offsets, and add the
+    indexed local_day columns.
+
+    The old times are assumed to be in the local time zone of this machine,
+    with the UTC offset that was in effect on their date.
+    """
+
+    for table in ('Tasks', 'Periods'):
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN start_offset INTEGER')
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN end_offset INTEGER')
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN local_day date')
+        rows = conn.execute(f'SELECT id, start_time, end_time FROM {table}')
+        conn.executemany(f"""UPDATE {table} SET start_time = :start_time,
+                             start_offset = :start_offset,
+                             end_time = :end_time, end_offset = :end_offset,
+                             local_day = :local_day WHERE id = :id""",
+                         [dict(_utc_columns(start, end), id=row_id)
+                          for row_id, start, end in rows.fetchall()])
+        conn.execute(f'CREATE INDEX {table}_local_day ON {table} (local_day)')
+
+
+# Schema migrations, in order. The database's user_version pragma is the
+# number of migrations that have been applied to it.
+_MIGRATIONS = [_add_sync_columns, _store_utc]
+
+
+def _to_utc(value):
+    """
+    Split a datetime into a naive UTC datetime and a UTC offset in seconds.
+
+    Naive datetimes are assumed to be in the local time zone.
+    """
+
+    if value is None:
+        return None, None
+    if value.tzinfo is None:
+        value = value.astimezone()
+    offset = value.utcoffset()
+    return (value - offset).replace(tzinfo=None), int(offset.total_seconds())
+
+
+def _from_utc(value, offset):
+    """Turn a naive UTC datetime and an offset back into an aware one."""
+
+    if value is None:
+        return None
+    return value.replace(tzinfo=timezone.utc).astimezone(
+        timezone(timedelta(seconds=offset)))
+
+
+def _utc_columns(start_time, end_time):
+    start_time_utc, start_offset = _to_utc(start_time)
+    end_time_utc, end_offset = _to_utc(end_time)
+    return {'start_time': start_time_utc, 'start_offset': start_offset,
+            'end_time': end_time_utc, 'end_offset': end_offset,
+            'local_day': start_time.date()}
+
+
+def _task_row(row):
+    task_id, description, start, start_offset, end, end_offset = row
+    return (task_id, description, _from_utc(start, start_offset),
+            _from_utc(end, end_offset))
+
+
+def _period_row(row):
+    period_id, p_type, start, start_offset, end, end_offset, task_id = row
+    return (period_id, p_type, _from_utc(start, start_offset),
+            _from_utc(end, end_offset), task_id)
+
+
+class AppendOnlyBackend(StorageBackend):
+
+    """
+    Append the tasks into a JSON lines file.
+
+    Each saved task is written as a single line containing the task and all
+    of its periods, so a save is one buffered write with no index updates.
+    Reading the tasks back requires a scan of the whole file.
+
+    A line that was cut off, e.g. by a crash in the middle of a save, is
+    skipped when reading.
+
+    Parameters
+    ----------
+
+    path : str or path-like
+        Path to the log file. Created if it doesn't exist.
+    fsync : boolean
+        Call os.fsync() after every save. Slower but survives power loss.
+        To save several tasks safely, call sync() once after saving them
+        instead.
+
+    """
+
+    def __init__(self, path, fsync=False):
+        self.path = pathlib.Path(path)
+        self.fsync = fsync
+        self._file = None
+        self._last_task_id = 0
+        self._last_period_id = 0
+
+    def _records(self):
+        if not self.path.exists():
+            return
+        if self._file is not None:
+            self._file.flush()
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+    def _open(self):
+        # The file is only read once something is saved, so that opening
+        # a backend, e.g. for a recovery file at exit, can't fail on it.
+        self._last_task_id = 0
+        self._last_period_id = 0
+        for record in self._records():
+            self._last_task_id = record['id']
+            if record['periods']:
+                self._last_period_id = record['periods'][-1][0]
+        self._file = open(self.path, 'a', encoding='utf-8')
+        if self._file.tell() and not self._ends_with_newline():
+            # Finish a line that was cut off, so that it doesn't swallow
+            # the next task.
+            self._file.write('\n')
+
+    def _ends_with_newline(self):
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def save_task(self, task):
+        if self._file is None:
+            self._open()
+        self._last_task_id += 1
+        periods = []
+        for p_type, start, end in task_periods(task):
+            self._last_period_id += 1
+            periods.append([self._last_period_id, p_type, dump_time(start),
+                            dump_time(end)])
+        record = {'id': self._last_task_id,
+                  'uid': task.uid,
+                  'description': task.description,
+                  'start_time': dump_time(task.start_time),
+                  'end_time': dump_time(task.end_time),
+                  'periods': periods}
+        self._file.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        return self._last_task_id
+
+    def tasks(self):
+        return [(r['id'], r['description'], load_time(r['start_time']),
+                 load_time(r['end_time'])) for r in self._records()]
+
+    def changes(self):
+        """
+        Return the saved tasks as changes for SQLiteBackend.apply_changes().
+        """
+
+        return [{'uid': r['uid'], 'description': r['description'],
+                 'start_time': load_time(r['start_time']),
+                 'end_time': load_time(r['end_time']),
+                 'periods': [(p_type, load_time(start), load_time(end))
+                             for _, p_type, start, end in r['periods']]}
+                for r in self._records()]
+
+    def periods(self, task_id=None):
+        periods = []
+        for r in self._records():
+            if task_id is not None and r['id'] != task_id:
+                continue
+            periods.extend((p_id, p_type, load_time(start), load_time(end),
+                            r['id']) for p_id, p_type, start, end
+                           in r['periods'])
+        return periods
+
+    def sync(self):
+        """Make sure the saved tasks survive a power loss."""
+
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def dump_time(value):
+    """Format a datetime, or None, as an ISO 8601 string for JSON."""
+
+    return None if value is None else value.isoformat()
+
+
+def load_time(value):
+    """Parse a string written by dump_time()."""
+
+    return None if value is None else datetime.fromisoformat(value)
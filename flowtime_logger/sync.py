@@ -0,0 +1,191 @@
+"""
+Sync the tasks between two flogger databases.
+
+Only the tasks that the other database hasn't seen yet are exchanged: each
+database remembers the last change sequence number it has pulled from every
+peer. Tasks are matched by their uid, so syncing is idempotent and never
+creates duplicates.
+
+Usage:
+
+    Sync two local database files:
+        $ python sync.py flogger.db other.db
+
+    Sync with a database on the other end of a pipe. The command is run and
+    the sync protocol is spoken over its stdin and stdout:
+        $ python sync.py flogger.db --command "ssh host python sync.py \
+flogger.db --stdio"
+
+    Sync over a socket. Run the listening end first:
+        $ python sync.py flogger.db --listen 8765
+        $ python sync.py other.db --connect localhost:8765
+
+Functions
+---------
+
+sync_backends(local, remote)
+    Sync two SQLiteBackends in the same process.
+sync_stream(backend, rfile, wfile)
+    Sync a SQLiteBackend with a peer on the other end of a pair of files.
+
+"""
+
+import argparse
+import json
+import shlex
+import socket
+import subprocess
+import sys
+import threading
+
+if __package__:
+    from . import storage
+else:  # Run as a script from the flowtime_logger directory.
+    import storage
+
+
+def sync_backends(local, remote):
+    """
+    Sync two SQLiteBackends both ways.
+
+    Returns a (sent, received) tuple with the number of tasks inserted into
+    the remote and the local database.
+    """
+
+    received = _pull(local, remote)
+    sent = _pull(remote, local)
+    return sent, received
+
+
+def _pull(dst, src):
+    since = dst.peer_mark(src.db_id)
+    changes, last_seq = src.changes_since(since, exclude_origin=dst.db_id)
+    return dst.apply_changes(changes, src.db_id, last_seq)
+
+
+def sync_stream(backend, rfile, wfile):
+    """
+    Sync a SQLiteBackend with a peer on the other end of a pair of files.
+
+    Both ends run this same function. The files must be binary; every
+    message is one line of JSON:
+
+    1. {"db_id": ...} - the id of the sender's database.
+    2. {"since": ...} - the last sequence number the sender has pulled from
+       the receiver.
+    3. One {"task": ...} message per change, followed by
+       {"last_seq": ...}.
+
+    The changes are written from a separate thread so that neither end can
+    block the other when both have a lot to send.
+
+    Returns a (sent, received) tuple with the number of tasks sent to the
+    peer and the number of tasks inserted into the local database.
+    """
+
+    _send(wfile, {'db_id': backend.db_id})
+    peer_id = _receive(rfile)['db_id']
+    _send(wfile, {'since': backend.peer_mark(peer_id)})
+    peer_since = _receive(rfile)['since']
+
+    # Read everything from the database in this thread, since sqlite3
+    # connections can't be shared between threads.
+    changes, last_seq = backend.changes_since(peer_since,
+                                              exclude_origin=peer_id)
+    messages = [{'task': _dump_change(change)} for change in changes]
+    messages.append({'last_seq': last_seq})
+    sender = threading.Thread(target=_send, args=(wfile, *messages))
+    sender.start()
+
+    received = []
+    while True:
+        message = _receive(rfile)
+        if 'last_seq' in message:
+            break
+        received.append(_load_change(message['task']))
+    sender.join()
+    inserted = backend.apply_changes(received, peer_id, message['last_seq'])
+    return len(changes), inserted
+
+
+def _send(wfile, *messages):
+    for message in messages:
+        wfile.write(json.dumps(message, separators=(',', ':')).encode()
+                    + b'\n')
+    wfile.flush()
+
+
+def _receive(rfile):
+    line = rfile.readline()
+    if not line:
+        raise ConnectionError('The peer closed the connection mid-sync.')
+    return json.loads(line)
+
+
+def _dump_change(change):
+    return _convert_times(change, storage.dump_time)
+
+
+def _load_change(change):
+    return _convert_times(change, storage.load_time)
+
+
+def _convert_times(change, convert):
+    return dict(change,
+                start_time=convert(change['start_time']),
+                end_time=convert(change['end_time']),
+                periods=[(p_type, convert(start), convert(end))
+                         for p_type, start, end in change['periods']])
+
+
+def _address(value):
+    host, _, port = value.rpartition(':')
+    return host or 'localhost', int(port)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Sync the tasks between two flogger databases.')
+    parser.add_argument('database', help='path to the local database')
+    peer = parser.add_mutually_exclusive_group(required=True)
+    peer.add_argument('other', nargs='?',
+                      help='path to another local database')
+    peer.add_argument('--stdio', action='store_true',
+                      help='speak the sync protocol on stdin and stdout')
+    peer.add_argument('--command',
+                      help='run a command and sync over its stdin and stdout')
+    peer.add_argument('--listen', metavar='[HOST:]PORT',
+                      help='wait for one connection and sync over it')
+    peer.add_argument('--connect', metavar='[HOST:]PORT',
+                      help='connect to a listening peer and sync over it')
+    args = parser.parse_args(argv)
+
+    with storage.SQLiteBackend(args.database) as backend:
+        if args.other:
+            with storage.SQLiteBackend(args.other) as other:
+                sent, received = sync_backends(backend, other)
+        elif args.stdio:
+            sent, received = sync_stream(backend, sys.stdin.buffer,
+                                         sys.stdout.buffer)
+        elif args.command:
+            with subprocess.Popen(shlex.split(args.command),
+                                  stdin=subprocess.PIPE,
+                                  stdout=subprocess.PIPE) as proc:
+                sent, received = sync_stream(backend, proc.stdout, proc.stdin)
+                proc.stdin.close()
+        else:
+            if args.listen:
+                with socket.create_server(_address(args.listen)) as server:
+                    conn, _ = server.accept()
+            else:
+                conn = socket.create_connection(_address(args.connect))
+            with conn, conn.makefile('rb') as rfile, \
+                    conn.makefile('wb') as wfile:
+                sent, received = sync_stream(backend, rfile, wfile)
+
+    # stdout may be carrying the protocol, so report on stderr.
+    print(f'Sent {sent} tasks, received {received} tasks.', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,309 @@
+import contextlib
+import io
+import os
+import signal
+import sqlite3
+import tempfile
+import time
+import tkinter as tk
+import unittest
+from unittest import mock
+
+import flowtime_logger.flowtime_logger as flowtime_logger
+import flowtime_logger.logger as logger
+import flowtime_logger.storage as storage
+from test_storage import make_task
+
+# Budgets for the desktop app. Generous enough for a loaded CI machine, but
+# far below what a blocking save or a forced layout pass on a locked
+# database would take.
+FIRST_FRAME_BUDGET = 1.0
+EXIT_DEADLINE = 0.2
+EXIT_BUDGET = 0.5
+
+
+def has_display():
+    try:
+        tk.Tk().destroy()
+    except tk.TclError:
+        return False
+    return True
+
+
+@unittest.skipUnless(has_display(), 'Tk needs a display')
+class TestMainApp(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, 'test.db')
+        self.recovery_path = os.path.join(self.tmp_dir.name,
+                                          'recovery.jsonl')
+        self.sigterm_handler = signal.getsignal(signal.SIGTERM)
+
+    def tearDown(self):
+        signal.signal(signal.SIGTERM, self.sigterm_handler)
+        self.tmp_dir.cleanup()
+
+    def make_app(self):
+        app = flowtime_logger.MainApp(
+            backend=storage.SQLiteBackend(self.db_path),
+            recovery_path=self.recovery_path, exit_deadline=EXIT_DEADLINE,
+            mainloop=False)
+        self.addCleanup(self.exit_app, app)
+        return app
+
+    def show_first_frame(self, app):
+        """Run the event loop until the first frame has been drawn."""
+        give_up = time.monotonic() + 5
+        while app.first_frame_time is None and time.monotonic() < give_up:
+            app.root.update()
+
+    def exit_app(self, app):
+        if app.exiting:
+            return
+        with self.assertRaises(SystemExit):
+            app.exit_handler()
+
+    def test_time_to_first_frame(self):
+        """The window is drawn within budget, before the DB is opened."""
+        app = self.make_app()
+        self.assertIsNone(app.backend._conn)
+        self.show_first_frame(app)
+
+        self.assertLess(app.first_frame_time, FIRST_FRAME_BUDGET)
+        self.assertIsNotNone(app.backend._conn)
+
+
+def make_headless_app(backend=None, recovery_path=None):
+    """
+    Create a MainApp without a window.
+
+    The startup and shutdown only talk to Tk through root and gui, so those
+    are mocks and everything else is real.
+    """
+    app = flowtime_logger.MainApp.__new__(flowtime_logger.MainApp)
+    app.init_started = time.perf_counter()
+    app.profiler = flowtime_logger.Profiler()
+    app.backend = backend or storage.MemoryBackend()
+    app.recovery_path = recovery_path
+    app.exit_deadline = EXIT_DEADLINE
+    app.manager = logger.TaskManager(app.backend)
+    app.first_frame_time = None
+    app.exit_time = None
+    app.exiting = False
+    app.root = mock.Mock()
+    app.gui = mock.Mock()
+    return app
+
+
+class TestWindowMapped(unittest.TestCase):
+
+    def setUp(self):
+        self.app = make_headless_app()
+        self.app._map_binding = 'binding'
+
+    def test_root_mapped(self):
+        """Mapping the root sets the min size and queues the startup."""
+        self.app.window_mapped(mock.Mock(widget=self.app.root))
+
+        self.app.root.unbind.assert_called_once_with('<Map>', 'binding')
+        self.app.gui.set_min_size.assert_called_once_with()
+        self.app.root.after_idle.assert_called_once_with(
+            self.app.finish_startup)
+
+    def test_child_mapped(self):
+        """Children being mapped don't finish the startup."""
+        self.app.window_mapped(mock.Mock(widget=mock.Mock()))
+
+        self.app.root.unbind.assert_not_called()
+        self.app.root.after_idle.assert_not_called()
+
+
+class TestRecover(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, 'test.db')
+        self.recovery_path = os.path.join(self.tmp_dir.name,
+                                          'recovery.jsonl')
+        with storage.AppendOnlyBackend(self.recovery_path) as recovery:
+            recovery.save_task(make_task('recovered', breaks=0))
+        self.backend = storage.SQLiteBackend(self.db_path)
+        self.app = make_headless_app(self.backend, self.recovery_path)
+
+    def tearDown(self):
+        self.backend.close()
+        self.tmp_dir.cleanup()
+
+    def test_recover(self):
+        """The recovered tasks are moved into the backend."""
+        self.app.finish_startup()
+
+        self.assertEqual(self.backend.tasks()[0][1], 'recovered')
+        self.assertFalse(os.path.exists(self.recovery_path))
+        self.app.root.after.assert_called_once()
+
+    def test_cut_off_line(self):
+        """A line cut off by a crash doesn't stop the recovery."""
+        with open(self.recovery_path, 'a', encoding='utf-8') as f:
+            f.write('{"id":2,"uid":"cut off')
+        self.app.finish_startup()
+
+        self.assertListEqual([t[1] for t in self.backend.tasks()],
+                             ['recovered'])
+        self.assertFalse(os.path.exists(self.recovery_path))
+
+    def test_locked_database(self):
+        """A locked DB doesn't freeze the startup or lose the tasks."""
+        lock = sqlite3.connect(self.db_path)
+        lock.execute('BEGIN EXCLUSIVE')
+        started = time.perf_counter()
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            self.app.finish_startup()
+        lock.close()
+
+        self.assertLess(time.perf_counter() - started,
+                        self.app.RECOVERY_TIMEOUT + 0.5)
+        self.assertIn('Could not open the storage', stderr.getvalue())
+        self.assertTrue(os.path.exists(self.recovery_path))
+        # The timer loop runs and the backend is usable afterwards.
+        self.app.root.after.assert_called_once()
+        self.assertEqual(self.backend.get_timeout(), 5.0)
+        self.assertListEqual(self.backend.tasks(), [])
+
+
+class TestExit(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, 'test.db')
+        self.recovery_path = os.path.join(self.tmp_dir.name,
+                                          'recovery.jsonl')
+        self.app = self.make_app()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def make_app(self):
+        backend = storage.SQLiteBackend(self.db_path)
+        self.addCleanup(backend.close)
+        app = make_headless_app(backend, self.recovery_path)
+        app.backend.open()
+        return app
+
+    def exit_app(self, *args):
+        with self.assertRaises(SystemExit):
+            self.app.exit_handler(*args)
+
+    def test_time_to_exit(self):
+        """All the active tasks are saved within the exit budget."""
+        for i in range(20):
+            self.app.manager.start(str(i))
+        self.exit_app()
+
+        self.assertLess(self.app.exit_time, EXIT_BUDGET)
+        self.app.root.destroy.assert_called_once_with()
+        with storage.SQLiteBackend(self.db_path) as backend:
+            self.assertEqual(len(backend.tasks()), 20)
+        self.assertFalse(os.path.exists(self.recovery_path))
+
+    def test_exit_with_locked_database(self):
+        """A locked DB is skipped and the tasks are recovered on restart."""
+        for i in range(20):
+            self.app.manager.start(str(i))
+        lock = sqlite3.connect(self.db_path)
+        lock.execute('BEGIN EXCLUSIVE')
+        with mock.patch.object(storage.os, 'fsync',
+                               wraps=storage.os.fsync) as fsync:
+            self.exit_app()
+        lock.close()
+
+        self.assertLess(self.app.exit_time, EXIT_BUDGET)
+        fsync.assert_called_once()
+        with storage.AppendOnlyBackend(self.recovery_path) as recovery:
+            self.assertEqual(len(recovery.tasks()), 20)
+
+        app = self.make_app()
+        app.finish_startup()
+        self.assertEqual(len(app.backend.tasks()), 20)
+        self.assertFalse(os.path.exists(self.recovery_path))
+
+    def test_cut_off_recovery_file(self):
+        """A damaged recovery file doesn't stop the tasks being saved."""
+        with open(self.recovery_path, 'w', encoding='utf-8') as f:
+            f.write('{"id":1,"uid":"cut off')
+        self.app.manager.start('test')
+        self.exit_app()
+
+        with storage.SQLiteBackend(self.db_path) as backend:
+            self.assertEqual(backend.tasks()[0][1], 'test')
+
+    def test_signal(self):
+        """exit_handler() works as a signal handler and only runs once."""
+        self.app.manager.start('test')
+        self.exit_app(signal.SIGTERM, None)
+        self.app.exit_handler()
+
+        self.app.root.destroy.assert_called_once_with()
+        with storage.SQLiteBackend(self.db_path) as backend:
+            self.assertEqual(backend.tasks()[0][1], 'test')
+
+
+class TestParseArgs(unittest.TestCase):
+
+    def test_defaults(self):
+        args = flowtime_logger.parse_args([], {})
+        self.assertIsNone(args.db)
+        self.assertEqual(args.backend, 'sqlite')
+        self.assertIsNone(args.journal_mode)
+        self.assertEqual(args.exit_deadline,
+                         flowtime_logger.MainApp.EXIT_DEADLINE)
+        self.assertIs(args.profile, False)
+
+    def test_environment(self):
+        """The environment variables set the defaults."""
+        args = flowtime_logger.parse_args([], {
+            'FLOGGER_DB': 'tasks.jsonl', 'FLOGGER_BACKEND': 'append-only',
+            'FLOGGER_JOURNAL_MODE': 'WAL', 'FLOGGER_EXIT_DEADLINE': '2.5',
+            'FLOGGER_PROFILE': '1'})
+        self.assertEqual(args.db, 'tasks.jsonl')
+        self.assertEqual(args.backend, 'append-only')
+        self.assertEqual(args.journal_mode, 'WAL')
+        self.assertEqual(args.exit_deadline, 2.5)
+        self.assertIs(args.profile, True)
+
+    def test_options_override_environment(self):
+        args = flowtime_logger.parse_args(
+            ['--db', 'other.db', '--exit-deadline', '0.5'],
+            {'FLOGGER_DB': 'tasks.db', 'FLOGGER_EXIT_DEADLINE': '3'})
+        self.assertEqual(args.db, 'other.db')
+        self.assertEqual(args.exit_deadline, 0.5)
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_report(self):
+        """The report lists every phase and the total."""
+        profiler = flowtime_logger.Profiler(enabled=True)
+        profiler.mark('first')
+        profiler.mark('second')
+        with tempfile.TemporaryFile('w+') as f:
+            profiler.report(f)
+            f.seek(0)
+            lines = f.read().splitlines()
+
+        self.assertListEqual([line.split()[0] for line in lines],
+                             ['first', 'second', 'total'])
+
+    def test_disabled(self):
+        """A disabled profiler records the phases but prints nothing."""
+        profiler = flowtime_logger.Profiler()
+        profiler.mark('first')
+        with tempfile.TemporaryFile('w+') as f:
+            profiler.report(f)
+            self.assertEqual(f.tell(), 0)
+        self.assertEqual(profiler.phases[0][0], 'first')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,13 @@
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import os
-import pathlib
 import sqlite3
+import tempfile
+import time
 import unittest
+from unittest import mock
 
 import flowtime_logger.logger as logger
+import flowtime_logger.storage as storage
 
 
 class TestTask(unittest.TestCase):
@@ -17,6 +20,7 @@ class TestTask(unittest.TestCase):
     def test_task_init(self):
         """Test the Task initialization."""
         self.assertIsInstance(self.task.start_time, datetime)
+        self.assertIsNotNone(self.task.start_time.utcoffset())
         self.assertEqual(self.task.start_time,
                          self.current_wp.wp_start_time)
         self.assertEqual(self.task.wp_count, 1)
@@ -103,6 +107,33 @@ class TestTask(unittest.TestCase):
         with self.assertRaises(AssertionError):
             self.task.end()
 
+    def test_work_time(self):
+        """work_time() sums the work periods up to the given time."""
+        task = logger.Task('test')
+        now = task.start_time + timedelta(minutes=5)
+
+        self.assertEqual(task.work_time(now), timedelta(minutes=5))
+        task.stop()
+        wp = task.wp_list[0]
+        self.assertEqual(task.work_time(now),
+                         wp.wp_end_time - wp.wp_start_time)
+
+    def test_work_time_many_periods(self):
+        """closed_work_time keeps the total of the ended work periods."""
+        task = logger.Task('test')
+        for _ in range(3):
+            task.stop()
+            task.cont()
+        task.stop()
+        total = sum((wp.wp_end_time - wp.wp_start_time
+                     for wp in task.wp_list), timedelta())
+
+        self.assertEqual(task.closed_work_time, total)
+        self.assertEqual(task.work_time(), total)
+        task.cont()
+        now = task.wp_list[-1].wp_start_time + timedelta(minutes=1)
+        self.assertEqual(task.work_time(now), total + timedelta(minutes=1))
+
     def update_periods(self):
 
         try:
@@ -116,6 +147,11 @@ class TestTask(unittest.TestCase):
             pass
 
 
+def utc(value):
+    """Return an aware datetime as the naive UTC time stored in the DB."""
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
 class TestTaskSave(unittest.TestCase):
 
     def setUp(self):
@@ -124,66 +160,220 @@ class TestTaskSave(unittest.TestCase):
         self.task.cont()
         self.task.stop()
         self.task.end()
-        self.task_tuple = (1, self.task.description, self.task.start_time,
-                           self.task.end_time)
+        self.task_tuple = (1, self.task.description,
+                           utc(self.task.start_time), utc(self.task.end_time))
 
         self.task2 = logger.Task('test2')
         self.task2.stop()
         self.task2.cont()
         self.task2.stop()
         self.task2.end()
-        self.task2_tuple = (2, self.task2.description, self.task2.start_time,
-                            self.task2.end_time)
+        self.task2_tuple = (2, self.task2.description,
+                            utc(self.task2.start_time),
+                            utc(self.task2.end_time))
 
         self.task_period_list = []
         self.list_count = 1
         for wp in self.task.wp_list:
             self.task_period_list.append((self.list_count, 'wp',
-                                         wp.wp_start_time, wp.wp_end_time, 1))
+                                         utc(wp.wp_start_time),
+                                         utc(wp.wp_end_time), 1))
             self.list_count += 1
 
         for bp in self.task.bp_list:
             self.task_period_list.append((self.list_count, 'bp',
-                                         bp.bp_start_time, bp.bp_end_time, 1))
+                                         utc(bp.bp_start_time),
+                                         utc(bp.bp_end_time), 1))
             self.list_count += 1
 
         for wp in self.task2.wp_list:
             self.task_period_list.append((self.list_count, 'wp',
-                                         wp.wp_start_time, wp.wp_end_time, 2))
+                                         utc(wp.wp_start_time),
+                                         utc(wp.wp_end_time), 2))
             self.list_count += 1
 
         for bp in self.task2.bp_list:
             self.task_period_list.append((self.list_count, 'bp',
-                                         bp.bp_start_time, bp.bp_end_time, 2))
+                                         utc(bp.bp_start_time),
+                                         utc(bp.bp_end_time), 2))
             self.list_count += 1
 
-        self.flogger_dir = pathlib.Path(logger.__file__).parent
-        self.path_to_db = self.flogger_dir.joinpath(self.flogger_dir,
-                                                    'test.db')
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path_to_db = os.path.join(self.tmp_dir.name, 'test.db')
+
+    def test_times_are_stored_in_utc(self):
+        """The offsets and the local day are stored next to the UTC times."""
+        with storage.SQLiteBackend(self.path_to_db) as backend:
+            self.task.save(backend)
+            row = backend.conn.execute("""SELECT start_offset, end_offset,
+                                          local_day FROM Tasks""").fetchone()
+
+        offset = self.task.start_time.utcoffset().total_seconds()
+        self.assertTupleEqual(row, (offset, offset,
+                                    self.task.start_time.date()))
 
     def test_task_save(self):
         """Test Task's save() method."""
-        self.task.save(database='test.db')
-        self.task2.save(database='test.db')
+        with storage.SQLiteBackend(self.path_to_db) as backend:
+            self.assertEqual(self.task.save(backend), 1)
+            self.assertEqual(self.task2.save(backend), 2)
 
         conn = sqlite3.connect(self.path_to_db,
                                detect_types=sqlite3.PARSE_DECLTYPES |
                                sqlite3.PARSE_COLNAMES)
         c = conn.cursor()
         with conn:
-            c.execute("""SELECT * FROM Tasks""")
+            c.execute("""SELECT id, description, start_time, end_time
+                         FROM Tasks""")
             task1 = c.fetchone()
             task2 = c.fetchone()
 
-            c.execute("""SELECT * FROM Periods""")
+            c.execute("""SELECT id, type, start_time, end_time, task_id
+                         FROM Periods""")
             periods = c.fetchall()
 
         self.assertTupleEqual(self.task_tuple, task1)
         self.assertTupleEqual(self.task2_tuple, task2)
         self.assertListEqual(self.task_period_list, periods)
+        conn.close()
 
     def tearDown(self):
-        os.remove(self.path_to_db)
+        self.tmp_dir.cleanup()
+
+
+class TestTaskManager(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = storage.MemoryBackend()
+        self.manager = logger.TaskManager(self.backend)
+
+    def test_start(self):
+        """Starting a task makes it the current, active task."""
+        task = self.manager.start('test')
+
+        self.assertIs(self.manager.current, task)
+        self.assertListEqual(self.manager.tasks, [task])
+        self.assertIs(task.task_running, True)
+
+    def test_start_pauses_running_task(self):
+        """In exclusive mode starting a task stops the running task."""
+        first = self.manager.start('first')
+        second = self.manager.start('second')
+
+        self.assertIs(first.task_running, False)
+        self.assertIs(first.task_ended, False)
+        self.assertIs(second.task_running, True)
+        self.assertIs(self.manager.current, second)
+        self.assertEqual(len(self.manager), 2)
+
+    def test_cont_pauses_running_task(self):
+        """In exclusive mode continuing a task stops the running task."""
+        first = self.manager.start('first')
+        second = self.manager.start('second')
+        self.manager.switch(first)
+        self.manager.cont()
+
+        self.assertIs(first.task_running, True)
+        self.assertIs(second.task_running, False)
+
+    def test_non_exclusive(self):
+        """Without exclusive mode tasks run in parallel."""
+        manager = logger.TaskManager(self.backend, exclusive=False)
+        tasks = [manager.start(str(i)) for i in range(3)]
+
+        self.assertTrue(all(task.task_running for task in tasks))
+
+    def test_switch(self):
+        """Switching changes the current task but not the task states."""
+        first = self.manager.start('first')
+        second = self.manager.start('second')
+        self.manager.switch(first)
+
+        self.assertIs(self.manager.current, first)
+        self.assertIs(first.task_running, False)
+        self.assertIs(second.task_running, True)
+
+    def test_switch_to_inactive_task(self):
+        """Switching to a task that is not active raises AssertionError."""
+        with self.assertRaises(AssertionError):
+            self.manager.switch(logger.Task('test'))
+
+    def test_end(self):
+        """Ending a task saves it and removes it from the active tasks."""
+        first = self.manager.start('first')
+        second = self.manager.start('second')
+        self.manager.stop()
+        self.manager.end()
+
+        self.assertIs(second.task_ended, True)
+        self.assertIsNone(self.manager.current)
+        self.assertListEqual(self.manager.tasks, [first])
+        self.assertNotIn(second, self.manager)
+        self.assertEqual(self.backend.tasks()[0][1], 'second')
+
+    def test_end_all(self):
+        """end_all() ends and saves every active task."""
+        for i in range(3):
+            self.manager.start(str(i))
+        self.manager.end_all()
+
+        self.assertEqual(len(self.manager), 0)
+        self.assertListEqual([t[1] for t in self.backend.tasks()],
+                             ['0', '1', '2'])
+
+    def test_end_all_after_deadline(self):
+        """Once the deadline has passed tasks are saved into the fallback."""
+        fallback = storage.MemoryBackend()
+        self.manager.start('test')
+        self.manager.end_all(time.monotonic() - 1, fallback)
+
+        self.assertListEqual(self.backend.tasks(), [])
+        self.assertEqual(fallback.tasks()[0][1], 'test')
+        self.assertEqual(len(self.manager), 0)
+
+    def test_end_all_when_saving_fails(self):
+        """Tasks that can't be saved into the backend go to the fallback."""
+        fallback = storage.MemoryBackend()
+        self.manager.start('test')
+        with mock.patch.object(self.backend, 'save_task',
+                               side_effect=OSError) as save_task:
+            self.manager.end_all(time.monotonic() + 10, fallback)
+
+        save_task.assert_called_once()
+        self.assertEqual(fallback.tasks()[0][1], 'test')
+        self.assertListEqual(self.backend.tasks(), [])
+
+    def test_end_all_with_locked_database(self):
+        """A locked database doesn't hold up end_all() past the deadline."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'test.db')
+            backend = storage.SQLiteBackend(path)
+            backend.open()
+            lock = sqlite3.connect(path)
+            lock.execute('BEGIN EXCLUSIVE')
+            manager = logger.TaskManager(backend)
+            fallback = storage.MemoryBackend()
+            manager.start('first')
+            manager.start('second')
+
+            started = time.monotonic()
+            manager.end_all(started + 0.2, fallback)
+            elapsed = time.monotonic() - started
+            lock.close()
+            backend.close()
+
+        self.assertLess(elapsed, 1)
+        self.assertListEqual([t[1] for t in fallback.tasks()],
+                             ['first', 'second'])
+
+    def test_many_tasks(self):
+        """Only one of many tasks is running in exclusive mode."""
+        tasks = [self.manager.start(str(i)) for i in range(100)]
+        self.manager.switch(tasks[10])
+        self.manager.cont()
+
+        running = [task for task in tasks if task.task_running]
+        self.assertListEqual(running, [tasks[10]])
 
 
 if __name__ == "__main__":
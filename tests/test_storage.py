@@ -0,0 +1,349 @@
+from datetime import date, datetime, timedelta, timezone
+import os
+import pathlib
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+import flowtime_logger.logger as logger
+import flowtime_logger.storage as storage
+
+
+def make_task(description, breaks=1):
+    """Create an ended task with the given number of breaks."""
+    task = logger.Task(description)
+    for _ in range(breaks):
+        task.stop()
+        task.cont()
+    task.stop()
+    task.end()
+    return task
+
+
+def make_task_at(description, start_time):
+    """Create an ended task with one hour long work period at start_time."""
+    task = make_task(description, breaks=0)
+    task.start_time = start_time
+    task.wp_list[0].wp_start_time = start_time
+    task.wp_list[0].wp_end_time = start_time + timedelta(hours=1)
+    task.end_time = task.wp_list[0].wp_end_time
+    return task
+
+
+HELSINKI_SUMMER = timezone(timedelta(hours=3))
+NEW_YORK_WINTER = timezone(timedelta(hours=-5))
+
+
+class BackendConformance:
+
+    """
+    Tests that every storage backend has to pass.
+
+    Subclasses must also inherit unittest.TestCase and implement
+    make_backend(). Backends that persist data should also implement
+    reopen_backend().
+    """
+
+    def make_backend(self):
+        raise NotImplementedError
+
+    def reopen_backend(self):
+        return None
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.backend = self.make_backend()
+
+    def tearDown(self):
+        self.backend.close()
+        self.tmp_dir.cleanup()
+
+    def test_empty(self):
+        """A new backend has no tasks or periods."""
+        self.assertListEqual(self.backend.tasks(), [])
+        self.assertListEqual(self.backend.periods(), [])
+
+    def test_save_task(self):
+        """Saved tasks and periods are returned as row tuples."""
+        task = make_task('test')
+        task_id = self.backend.save_task(task)
+
+        self.assertEqual(task_id, 1)
+        self.assertListEqual(self.backend.tasks(),
+                             [(1, 'test', task.start_time, task.end_time)])
+        wp1, wp2 = task.wp_list
+        bp, = task.bp_list
+        self.assertListEqual(self.backend.periods(), [
+            (1, 'wp', wp1.wp_start_time, wp1.wp_end_time, 1),
+            (2, 'wp', wp2.wp_start_time, wp2.wp_end_time, 1),
+            (3, 'bp', bp.bp_start_time, bp.bp_end_time, 1),
+        ])
+
+    def test_task_save_uses_backend(self):
+        """Task.save() saves into the given backend."""
+        self.assertEqual(make_task('test').save(self.backend), 1)
+        self.assertEqual(len(self.backend.tasks()), 1)
+
+    def test_ids_increase(self):
+        """Each saved task gets the next id."""
+        ids = [self.backend.save_task(make_task(str(i))) for i in range(3)]
+
+        self.assertListEqual(ids, [1, 2, 3])
+        self.assertListEqual([t[1] for t in self.backend.tasks()],
+                             ['0', '1', '2'])
+        self.assertEqual(len(self.backend.periods()), 9)
+
+    def test_periods_by_task(self):
+        """periods(task_id) only returns the periods of that task."""
+        self.backend.save_task(make_task('first', breaks=0))
+        self.backend.save_task(make_task('second', breaks=2))
+
+        self.assertEqual(len(self.backend.periods(1)), 1)
+        self.assertEqual(len(self.backend.periods(2)), 5)
+        self.assertTrue(all(p[4] == 2 for p in self.backend.periods(2)))
+        self.assertListEqual(self.backend.periods(3), [])
+
+    def test_offsets_are_kept(self):
+        """Times come back in the UTC offset they were captured in."""
+        start = datetime(2021, 7, 1, 23, 30, tzinfo=HELSINKI_SUMMER)
+        self.backend.save_task(make_task_at('late', start))
+
+        task = self.backend.tasks()[0]
+        self.assertEqual(task[2], start)
+        self.assertEqual(task[2].utcoffset(), timedelta(hours=3))
+        self.assertEqual(self.backend.periods()[0][3].utcoffset(),
+                         timedelta(hours=3))
+
+    def test_tasks_between(self):
+        """Tasks are looked up by the local day they were started on."""
+        # 23:30 in Helsinki is 20:30 UTC, 00:30 in New York is 05:30 UTC.
+        self.backend.save_task(make_task_at(
+            'late', datetime(2021, 7, 1, 23, 30, tzinfo=HELSINKI_SUMMER)))
+        self.backend.save_task(make_task_at(
+            'early', datetime(2021, 1, 2, 0, 30, tzinfo=NEW_YORK_WINTER)))
+        self.backend.save_task(make_task_at(
+            'other', datetime(2021, 7, 5, 12, 0, tzinfo=timezone.utc)))
+
+        def descriptions(tasks):
+            return [task[1] for task in tasks]
+
+        self.assertListEqual(descriptions(self.backend.tasks_on(
+            date(2021, 7, 1))), ['late'])
+        self.assertListEqual(descriptions(self.backend.tasks_on(
+            date(2021, 1, 2))), ['early'])
+        self.assertListEqual(descriptions(self.backend.tasks_on(
+            date(2021, 1, 1))), [])
+        self.assertListEqual(descriptions(self.backend.tasks_in_week(
+            date(2021, 7, 4))), ['late'])
+        self.assertListEqual(descriptions(self.backend.tasks_in_month(
+            date(2021, 7, 31))), ['late', 'other'])
+        self.assertListEqual(descriptions(self.backend.tasks_between(
+            date(2021, 1, 1), date(2021, 12, 31))),
+            ['late', 'early', 'other'])
+        self.assertListEqual([p[4] for p in self.backend.periods_between(
+            date(2021, 7, 1), date(2021, 7, 1))], [1])
+
+    def test_persistence(self):
+        """Tasks survive closing and reopening the backend."""
+        task = make_task('test')
+        self.backend.save_task(task)
+        self.backend.close()
+        self.backend = self.reopen_backend()
+        if self.backend is None:
+            self.backend = self.make_backend()
+            self.skipTest('backend is not persistent')
+
+        self.assertListEqual(self.backend.tasks(),
+                             [(1, 'test', task.start_time, task.end_time)])
+        self.assertEqual(len(self.backend.periods()), 3)
+        self.assertEqual(self.backend.save_task(make_task('next')), 2)
+        self.assertEqual(self.backend.periods(2)[0][0], 4)
+
+
+class TestOpenBackend(unittest.TestCase):
+
+    def test_kinds(self):
+        """open_backend() creates the backend with the given name."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'test.db')
+            backend = storage.open_backend('sqlite', path, 'WAL')
+            self.assertIsInstance(backend, storage.SQLiteBackend)
+            self.assertEqual(backend.path, path)
+            self.assertEqual(backend.journal_mode, 'WAL')
+            self.assertIsInstance(storage.open_backend('append-only', path),
+                                  storage.AppendOnlyBackend)
+        self.assertIsInstance(storage.open_backend('memory'),
+                              storage.MemoryBackend)
+
+    def test_unknown_kind(self):
+        with self.assertRaises(ValueError):
+            storage.open_backend('csv')
+
+    def test_incomplete_backend(self):
+        """A backend missing methods can't be created."""
+        class Incomplete(storage.StorageBackend):
+            def save_task(self, task):
+                return 1
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+
+class TestRecoveryPath(unittest.TestCase):
+
+    def test_next_to_database(self):
+        """Each database gets its own recovery file next to it."""
+        path = os.path.join('data', 'work.db')
+        self.assertEqual(storage.recovery_path(path),
+                         pathlib.Path('data', 'work.db.recovery.jsonl'))
+        self.assertNotEqual(storage.recovery_path('other.db'),
+                            storage.recovery_path(path))
+
+    def test_recovery_file(self):
+        """Only the SQLite backend needs a recovery file."""
+        backend = storage.SQLiteBackend(os.path.join('data', 'work.db'))
+        self.assertEqual(backend.recovery_file(),
+                         storage.recovery_path(backend.path))
+        self.assertIsNone(storage.MemoryBackend().recovery_file())
+        self.assertIsNone(storage.AppendOnlyBackend('tasks.jsonl')
+                          .recovery_file())
+
+
+class TestMemoryBackend(BackendConformance, unittest.TestCase):
+
+    def make_backend(self):
+        return storage.MemoryBackend()
+
+
+class TestSQLiteBackend(BackendConformance, unittest.TestCase):
+
+    def make_backend(self):
+        return storage.SQLiteBackend(os.path.join(self.tmp_dir.name,
+                                                  'test.db'),
+                                     journal_mode='WAL',
+                                     synchronous='NORMAL')
+
+    def reopen_backend(self):
+        return self.make_backend()
+
+    def test_day_lookups_use_index(self):
+        """Day lookups are index range seeks on the local_day column."""
+        plan = self.backend.conn.execute(
+            """EXPLAIN QUERY PLAN SELECT id FROM Tasks
+               WHERE local_day BETWEEN ? AND ?""",
+            (date(2021, 1, 1), date(2021, 1, 31))).fetchall()
+
+        self.assertIn('Tasks_local_day', plan[0][-1])
+
+    def test_recover_from_append_only_file(self):
+        """Tasks in a recovery file can be moved into the database."""
+        task = make_task('test')
+        path = os.path.join(self.tmp_dir.name, 'recovery.jsonl')
+        with storage.AppendOnlyBackend(path) as recovery:
+            recovery.save_task(task)
+            changes = recovery.changes()
+
+        self.assertEqual(self.backend.apply_changes(changes), 1)
+        self.assertEqual(self.backend.apply_changes(changes), 0)
+        self.assertListEqual(self.backend.tasks(),
+                             [(1, 'test', task.start_time, task.end_time)])
+        self.assertEqual(len(self.backend.periods(1)), 3)
+        self.assertEqual(self.backend.changes_since(0)[0][0]['origin'],
+                         self.backend.db_id)
+
+    def test_set_timeout(self):
+        """set_timeout() changes the busy timeout of an open connection."""
+        self.backend.open()
+        self.backend.set_timeout(0.25)
+
+        self.assertEqual(self.backend.conn.execute(
+            'PRAGMA busy_timeout').fetchone()[0], 250)
+        self.assertEqual(self.backend.get_timeout(), 0.25)
+
+    def test_concurrent_saves_get_unique_seqs(self):
+        """Saves from several connections never share a seq."""
+        def save(name):
+            with storage.SQLiteBackend(self.backend.path) as backend:
+                for i in range(20):
+                    backend.save_task(make_task(f'{name}{i}', breaks=0))
+
+        self.backend.open()
+        threads = [threading.Thread(target=save, args=(name,))
+                   for name in 'abc']
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        seqs = [row[0] for row in self.backend.conn.execute(
+            'SELECT seq FROM Tasks ORDER BY seq')]
+        self.assertListEqual(seqs, list(range(1, 61)))
+        unique = {name: is_unique for _, name, is_unique, *_ in
+                  self.backend.conn.execute('PRAGMA index_list(Tasks)')}
+        self.assertEqual(unique['Tasks_seq'], 1)
+
+    def test_open_while_another_connection_writes(self):
+        """An up to date database opens without waiting for the lock."""
+        self.backend.open()
+        self.backend.close()
+        writer = sqlite3.connect(self.backend.path)
+        writer.execute('BEGIN IMMEDIATE')
+        self.addCleanup(writer.close)
+
+        backend = storage.SQLiteBackend(self.backend.path, timeout=0.05)
+        backend.open()
+        self.assertListEqual(backend.tasks(), [])
+        backend.close()
+
+    def test_failed_open_is_retried(self):
+        """A database that can't be set up isn't left half open."""
+        writer = sqlite3.connect(self.backend.path)
+        writer.execute('BEGIN EXCLUSIVE')
+        self.backend.set_timeout(0.05)
+
+        with self.assertRaises(sqlite3.OperationalError):
+            self.backend.open()
+        self.assertIsNone(self.backend._conn)
+        writer.close()
+        self.assertEqual(self.backend.save_task(make_task('test')), 1)
+
+    def test_connection_is_lazy(self):
+        """No database file is created before the backend is used."""
+        self.assertFalse(os.path.exists(self.backend.path))
+
+
+class TestAppendOnlyBackend(BackendConformance, unittest.TestCase):
+
+    def make_backend(self):
+        return storage.AppendOnlyBackend(os.path.join(self.tmp_dir.name,
+                                                      'test.jsonl'))
+
+    def reopen_backend(self):
+        return self.make_backend()
+
+    def test_one_line_per_task(self):
+        """Each saved task is appended as a single line."""
+        self.backend.save_task(make_task('first'))
+        self.backend.save_task(make_task('second'))
+
+        with open(self.backend.path, encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+    def test_cut_off_line(self):
+        """A line cut off by a crash is skipped and not appended to."""
+        self.backend.save_task(make_task('first'))
+        self.backend.close()
+        with open(self.backend.path, 'a', encoding='utf-8') as f:
+            f.write('{"id":2,"uid":"cut off')
+
+        self.backend = self.make_backend()
+        self.assertListEqual([t[1] for t in self.backend.tasks()], ['first'])
+        self.assertEqual(len(self.backend.changes()), 1)
+        self.assertEqual(self.backend.save_task(make_task('second')), 2)
+        self.assertListEqual([t[1] for t in self.backend.tasks()],
+                             ['first', 'second'])
+
+
+if __name__ == "__main__":
+    unittest.main()
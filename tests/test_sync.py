@@ -0,0 +1,245 @@
+from datetime import datetime
+import os
+import pathlib
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+import flowtime_logger.storage as storage
+import flowtime_logger.sync as sync
+from test_storage import make_task
+
+SYNC_SCRIPT = pathlib.Path(sync.__file__)
+
+
+class SyncTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_a = self.path('a.db')
+        self.db_b = self.path('b.db')
+        self.a = storage.SQLiteBackend(self.db_a)
+        self.b = storage.SQLiteBackend(self.db_b)
+
+    def tearDown(self):
+        self.a.close()
+        self.b.close()
+        self.tmp_dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmp_dir.name, name)
+
+    def descriptions(self, backend):
+        return sorted(task[1] for task in backend.tasks())
+
+
+class TestSyncBackends(SyncTestCase):
+
+    def test_sync_both_ways(self):
+        """Tasks from both databases end up in both databases."""
+        self.a.save_task(make_task('a1'))
+        self.a.save_task(make_task('a2'))
+        self.b.save_task(make_task('b1'))
+
+        self.assertTupleEqual(sync.sync_backends(self.a, self.b), (2, 1))
+        self.assertListEqual(self.descriptions(self.a), ['a1', 'a2', 'b1'])
+        self.assertListEqual(self.descriptions(self.b), ['a1', 'a2', 'b1'])
+        self.assertEqual(len(self.a.periods()), 9)
+        self.assertEqual(len(self.b.periods()), 9)
+
+    def test_periods_follow_tasks(self):
+        """Synced periods point at the local id of their task."""
+        self.b.save_task(make_task('b0'))
+        task = make_task('a1')
+        self.a.save_task(task)
+        sync.sync_backends(self.a, self.b)
+
+        task_id = [t[0] for t in self.b.tasks() if t[1] == 'a1'][0]
+        self.assertListEqual(
+            [p[1:4] for p in self.b.periods(task_id)],
+            storage.task_periods(task))
+
+    def test_idempotent(self):
+        """Syncing again without changes transfers nothing."""
+        self.a.save_task(make_task('a1'))
+        self.b.save_task(make_task('b1'))
+        sync.sync_backends(self.a, self.b)
+
+        self.assertTupleEqual(sync.sync_backends(self.a, self.b), (0, 0))
+        self.assertTupleEqual(sync.sync_backends(self.b, self.a), (0, 0))
+        self.assertEqual(len(self.a.tasks()), 2)
+        self.assertEqual(len(self.b.tasks()), 2)
+
+    def test_only_delta_is_exchanged(self):
+        """After a sync only the new tasks are looked at."""
+        for i in range(10):
+            self.a.save_task(make_task(str(i)))
+        sync.sync_backends(self.a, self.b)
+        self.a.save_task(make_task('new'))
+
+        changes, _ = self.a.changes_since(self.b.peer_mark(self.a.db_id))
+        self.assertListEqual([c['description'] for c in changes], ['new'])
+        self.assertTupleEqual(sync.sync_backends(self.a, self.b), (1, 0))
+
+    def test_own_tasks_are_not_echoed(self):
+        """Tasks are not sent back to the database they came from."""
+        self.a.save_task(make_task('a1'))
+        sync.sync_backends(self.a, self.b)
+
+        changes, last_seq = self.b.changes_since(0,
+                                                 exclude_origin=self.a.db_id)
+        self.assertListEqual(changes, [])
+        self.assertEqual(last_seq, 1)
+
+    def test_deduplicate(self):
+        """A task already in both databases is not inserted twice."""
+        task = make_task('shared')
+        self.a.save_task(task)
+        self.b.save_task(task)
+
+        self.assertTupleEqual(sync.sync_backends(self.a, self.b), (0, 0))
+        self.assertEqual(len(self.a.tasks()), 1)
+        self.assertEqual(len(self.b.tasks()), 1)
+
+    def test_three_databases(self):
+        """Tasks travel through an intermediate database."""
+        with storage.SQLiteBackend(self.path('c.db')) as c:
+            c.save_task(make_task('c1'))
+            sync.sync_backends(self.a, c)
+            sync.sync_backends(self.a, self.b)
+            sync.sync_backends(self.b, c)
+
+            self.assertListEqual(self.descriptions(self.b), ['c1'])
+            self.assertEqual(len(c.tasks()), 1)
+
+
+class TestMigration(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def make_legacy_db(self, name, copies=1):
+        """
+        Create a database with the schema of the first version, holding
+        the given number of copies of the same task.
+        """
+        path = os.path.join(self.tmp_dir.name, name)
+        conn = sqlite3.connect(path)
+        with conn:
+            conn.execute("""CREATE TABLE Tasks (id INTEGER PRIMARY KEY,
+                            description TEXT, start_time timestamp,
+                            end_time timestamp)""")
+            conn.execute("""CREATE TABLE Periods (id INTEGER PRIMARY KEY,
+                            type TEXT, start_time timestamp,
+                            end_time timestamp, task_id INTEGER)""")
+            for task_id in range(1, copies + 1):
+                conn.execute("""INSERT INTO Tasks VALUES (?, 'old',
+                                '2020-01-01 10:00:00',
+                                '2020-01-01 11:00:00')""", (task_id,))
+                conn.execute("""INSERT INTO Periods VALUES (?, 'wp',
+                                '2020-01-01 10:00:00',
+                                '2020-01-01 11:00:00', ?)""",
+                             (task_id, task_id))
+        conn.close()
+        return path
+
+    def test_legacy_rows_are_migrated(self):
+        """Old databases get uids, sequence numbers and a db_id."""
+        with storage.SQLiteBackend(self.make_legacy_db('old.db')) as backend:
+            start = datetime(2020, 1, 1, 10).astimezone()
+            end = datetime(2020, 1, 1, 11).astimezone()
+            self.assertEqual(backend.tasks(), [(1, 'old', start, end)])
+            changes, last_seq = backend.changes_since(0)
+            self.assertEqual(last_seq, 1)
+            self.assertEqual(changes[0]['uid'], storage.legacy_uid(
+                'old', datetime(2020, 1, 1, 10)))
+            self.assertEqual(changes[0]['origin'], backend.db_id)
+            self.assertEqual(backend.save_task(make_task('new')), 2)
+
+    def test_duplicated_legacy_rows(self):
+        """Copies of a task within an old database are merged into one."""
+        path = self.make_legacy_db('dup.db', copies=3)
+        with storage.SQLiteBackend(path) as backend:
+            self.assertListEqual([t[0] for t in backend.tasks()], [1])
+            self.assertListEqual([p[4] for p in backend.periods()], [1])
+            self.assertEqual(backend.save_task(make_task('new')), 2)
+        with storage.SQLiteBackend(path) as backend:
+            self.assertEqual(len(backend.tasks()), 2)
+
+    def test_copies_of_legacy_db_are_deduplicated(self):
+        """Copies of the same old database don't duplicate each other."""
+        with storage.SQLiteBackend(self.make_legacy_db('a.db')) as a, \
+                storage.SQLiteBackend(self.make_legacy_db('b.db')) as b:
+            self.assertNotEqual(a.db_id, b.db_id)
+            self.assertTupleEqual(sync.sync_backends(a, b), (0, 0))
+            self.assertEqual(len(a.tasks()), 1)
+
+
+class TestSyncStream(SyncTestCase):
+
+    def test_socket(self):
+        """Two databases sync over a socket pair."""
+        for i in range(50):
+            self.a.save_task(make_task(f'a{i}'))
+        self.b.save_task(make_task('b1'))
+        self.b.close()
+        left, right = socket.socketpair()
+        result = {}
+
+        def remote():
+            with storage.SQLiteBackend(self.db_b) as b, \
+                    right.makefile('rb') as rfile, \
+                    right.makefile('wb') as wfile:
+                result['remote'] = sync.sync_stream(b, rfile, wfile)
+
+        thread = threading.Thread(target=remote)
+        thread.start()
+        with left.makefile('rb') as rfile, left.makefile('wb') as wfile:
+            local = sync.sync_stream(self.a, rfile, wfile)
+        thread.join()
+        left.close()
+        right.close()
+
+        self.assertTupleEqual(local, (50, 1))
+        self.assertTupleEqual(result['remote'], (1, 50))
+        self.assertEqual(len(self.a.tasks()), 51)
+        self.assertEqual(len(self.b.tasks()), 51)
+
+    def test_pipe(self):
+        """The command line tool syncs over a pipe to another process."""
+        self.a.save_task(make_task('a1'))
+        self.b.save_task(make_task('b1'))
+        self.a.close()
+        self.b.close()
+        command = f'"{sys.executable}" "{SYNC_SCRIPT}" "{self.db_b}" --stdio'
+
+        for _ in range(2):
+            subprocess.run([sys.executable, SYNC_SCRIPT, self.db_a,
+                            '--command', command], check=True,
+                           capture_output=True)
+
+        self.assertListEqual(self.descriptions(self.a), ['a1', 'b1'])
+        self.assertListEqual(self.descriptions(self.b), ['a1', 'b1'])
+
+    def test_local_files(self):
+        """The command line tool syncs two local files."""
+        self.a.save_task(make_task('a1'))
+        self.a.close()
+
+        proc = subprocess.run([sys.executable, SYNC_SCRIPT, self.db_a,
+                               self.db_b], check=True, capture_output=True,
+                              text=True)
+
+        self.assertIn('Sent 1 tasks, received 0 tasks.', proc.stderr)
+        self.assertListEqual(self.descriptions(self.b), ['a1'])
+
+
+if __name__ == "__main__":
+    unittest.main()